@@ -34,12 +34,14 @@ def is_valid_url(url):
         return False
 
 
-def unzip_install(files):
+def unzip_install(files, log=None):
     temp_filename = 'manager-temp.zip'
     for url in files:
         if url.endswith("/"):
             url = url[:-1]
         try:
+            if log is not None:
+                log(f"Download: {url}")
             headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
 
             req = urllib.request.Request(url, headers=headers)
@@ -50,39 +52,47 @@ def unzip_install(files):
                 f.write(data)
 
             with zipfile.ZipFile(temp_filename, 'r') as zip_ref:
+                if log is not None:
+                    log(f"Extract: {len(zip_ref.namelist())} files to {custom_nodes_path}")
                 zip_ref.extractall(custom_nodes_path)
 
             os.remove(temp_filename)
         except Exception as e:
             print(f"Install(unzip) error: {url} / {e}", file=sys.stderr)
+            if log is not None:
+                log(f"Install(unzip) error: {url} / {e}")
             return False
 
     print("Installation was successful.")
     return True
 
 
-def copy_install(files, js_path_name=None):
+def copy_install(files, js_path_name=None, log=None):
     for url in files:
         if url.endswith("/"):
             url = url[:-1]
         try:
             if url.endswith(".py"):
-                download_url(url, custom_nodes_path)
+                path = custom_nodes_path
             else:
                 path = os.path.join(js_path, js_path_name) if js_path_name is not None else js_path
                 if not os.path.exists(path):
                     os.makedirs(path)
-                download_url(url, path)
+            if log is not None:
+                log(f"Download: {url} to {path}")
+            download_url(url, path)
 
         except Exception as e:
             print(f"Install(copy) error: {url} / {e}", file=sys.stderr)
+            if log is not None:
+                log(f"Install(copy) error: {url} / {e}")
             return False
 
     print("Installation was successful.")
     return True
 
 
-def copy_uninstall(files, js_path_name='.'):
+def copy_uninstall(files, js_path_name='.', log=None):
     for url in files:
         if url.endswith("/"):
             url = url[:-1]
@@ -97,15 +107,19 @@ def copy_uninstall(files, js_path_name='.'):
                 os.remove(file_path + ".disabled")
         except Exception as e:
             print(f"Uninstall(copy) error: {url} / {e}", file=sys.stderr)
+            if log is not None:
+                log(f"Uninstall(copy) error: {url} / {e}")
             return False
 
     print("Uninstallation was successful.")
     return True
 
 
-def handle_stream(stream, prefix):
+def handle_stream(stream, prefix, log=None):
     stream.reconfigure(encoding=locale.getpreferredencoding(), errors='replace')
     for msg in stream:
+        if log is not None:
+            log(f"{prefix} {msg}" if prefix else msg)
         if prefix == '[!]' and ('it/s]' in msg or 's/it]' in msg) and ('%|' in msg or 'it [' in msg):
             if msg.startswith('100%'):
                 print('\r' + msg, end="", file=sys.stderr),
@@ -118,15 +132,16 @@ def handle_stream(stream, prefix):
                 print(prefix, msg, end="")
 
 
-def run_script(cmd, cwd='.'):
+def run_script(cmd, cwd='.', log=None):
+    # log: optional callback receiving every output line of the script while it runs
     if len(cmd) > 0 and cmd[0].startswith("#"):
         print(f"[ComfyUI-Manager] Unexpected behavior: `{cmd}`")
         return 0
 
     process = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1)
 
-    stdout_thread = threading.Thread(target=handle_stream, args=(process.stdout, ""))
-    stderr_thread = threading.Thread(target=handle_stream, args=(process.stderr, "[!]"))
+    stdout_thread = threading.Thread(target=handle_stream, args=(process.stdout, "", log))
+    stderr_thread = threading.Thread(target=handle_stream, args=(process.stderr, "[!]", log))
 
     stdout_thread.start()
     stderr_thread.start()
@@ -137,7 +152,7 @@ def run_script(cmd, cwd='.'):
     return process.wait()
 
 
-def try_install_script(url, repo_path, install_cmd):
+def try_install_script(url, repo_path, install_cmd, log=None):
     if (len(install_cmd) > 0 and install_cmd[0].startswith('#')):
         if not os.path.exists(startup_script_path):
             os.makedirs(startup_script_path)
@@ -150,16 +165,19 @@ def try_install_script(url, repo_path, install_cmd):
         return True
     else:
         print(f"\n## ComfyUI-Manager: EXECUTE => {install_cmd}")
-        code = run_script(install_cmd, cwd=repo_path)
+        if log is not None:
+            log(f"EXECUTE => {install_cmd}")
+        code = run_script(install_cmd, cwd=repo_path, log=log)
 
         if code != 0:
             if url is None:
                 url = os.path.dirname(repo_path)
             print(f"install script failed: {url}")
             return False
+        return True
 
 
-def execute_install_script(url, repo_path, lazy_mode=False):
+def execute_install_script(url, repo_path, lazy_mode=False, log=None):
     install_script_path = os.path.join(repo_path, "install.py")
     requirements_path = os.path.join(repo_path, "requirements.txt")
 
@@ -169,18 +187,21 @@ def execute_install_script(url, repo_path, lazy_mode=False):
     else:
         if os.path.exists(requirements_path):
             print("Install: pip packages")
-            with open(requirements_path, "r") as requirements_file:
-                for line in requirements_file:
-                    package_name = line.strip()
-                    if package_name:
-                        install_cmd = [sys.executable, "-m", "pip", "install", package_name]
-                        if package_name.strip() != "":
-                            try_install_script(url, repo_path, install_cmd)
+            # resolve all requirements with a single pip process, one pip process per line is only used as a fallback
+            # so that a single broken requirement doesn't prevent the others from being installed
+            install_cmd = [sys.executable, "-m", "pip", "install", "-r", "requirements.txt"]
+            if not try_install_script(url, repo_path, install_cmd, log=log):
+                with open(requirements_path, "r") as requirements_file:
+                    for line in requirements_file:
+                        package_name = line.strip()
+                        if package_name and not package_name.startswith("#"):
+                            install_cmd = [sys.executable, "-m", "pip", "install", package_name]
+                            try_install_script(url, repo_path, install_cmd, log=log)
 
         if os.path.exists(install_script_path):
             print(f"Install: install script")
             install_cmd = [sys.executable, "install.py"]
-            try_install_script(url, repo_path, install_cmd)
+            try_install_script(url, repo_path, install_cmd, log=log)
 
     return True
 
@@ -208,7 +229,7 @@ def rmtree(path):
             print(f"Uninstall retry({retry_count})")
 
 
-def gitclone_uninstall(files):
+def gitclone_uninstall(files, log=None):
     import shutil
     import os
 
@@ -229,13 +250,13 @@ def gitclone_uninstall(files):
             disable_script_path = os.path.join(dir_path, "disable.py")
             if os.path.exists(install_script_path):
                 uninstall_cmd = [sys.executable, "uninstall.py"]
-                code = run_script(uninstall_cmd, cwd=dir_path)
+                code = run_script(uninstall_cmd, cwd=dir_path, log=log)
 
                 if code != 0:
                     print(f"An error occurred during the execution of the uninstall.py script. Only the '{dir_path}' will be deleted.")
             elif os.path.exists(disable_script_path):
                 disable_script = [sys.executable, "disable.py"]
-                code = run_script(disable_script, cwd=dir_path)
+                code = run_script(disable_script, cwd=dir_path, log=log)
                 if code != 0:
                     print(f"An error occurred during the execution of the disable.py script. Only the '{dir_path}' will be deleted.")
 
@@ -245,6 +266,8 @@ def gitclone_uninstall(files):
                 rmtree(dir_path + ".disabled")
         except Exception as e:
             print(f"Uninstall(git-clone) error: {url} / {e}", file=sys.stderr)
+            if log is not None:
+                log(f"Uninstall(git-clone) error: {url} / {e}")
             return False
 
     print("Uninstallation was successful.")
@@ -1,5 +1,13 @@
 import os
 import time
+import threading
+
+try:
+    import watchdog.observers as watchdog_observers
+    import watchdog.events as watchdog_events
+except ImportError:
+    watchdog_observers = None
+    watchdog_events = None
 
 supported_pt_extensions = set(['.ckpt', '.pt', '.bin', '.pth', '.safetensors'])
 
@@ -37,9 +45,15 @@ output_directory = os.path.join(os.path.dirname(os.path.realpath(__file__)), "ou
 temp_directory = os.path.join(os.path.dirname(os.path.realpath(__file__)), "temp")
 input_directory = os.path.join(os.path.dirname(os.path.realpath(__file__)), "input")
 user_directory = os.path.join(os.path.dirname(os.path.realpath(__file__)), "user")
+cache_directory = os.path.join(user_directory, "cache") #files rebuilt when missing, like the node info cache
 
 filename_list_cache = {}
 
+folder_indexes = {}
+folder_indexes_lock = threading.Lock()
+use_filesystem_watcher = True
+WATCHER_POLL_INTERVAL = 60 #seconds between full mtime checks even when a watcher is running, in case it missed events
+
 if not os.path.exists(input_directory):
     try:
         os.makedirs(input_directory)
@@ -77,6 +91,12 @@ def get_input_directory():
     return input_directory
 
 
+def get_cache_directory():
+    global cache_directory
+    os.makedirs(cache_directory, exist_ok=True)
+    return cache_directory
+
+
 #NOTE: used in http server so don't put folders that should not be accessed remotely
 def get_directory_by_type(type_name):
     if type_name == "output":
@@ -190,15 +210,179 @@ def get_full_path(folder_name, filename):
     return None
 
 
+class FolderIndex:
+    """Incrementally updated listing of all the files under a directory.
+
+    Every directory is listed on its own (without recursion) and stored with its mtime, when a directory changes
+    only that directory is listed again. Changes are detected with a filesystem watcher when watchdog is available
+    and by polling the directory mtimes otherwise.
+    """
+    def __init__(self, root, excluded_dir_names):
+        self.root = root
+        self.excluded_dir_names = set(excluded_dir_names)
+        self.dirs = {}
+        self.dirty = set()
+        self.lock = threading.RLock()
+        self.version = 0
+        self.files_cache = None
+        self.observer = None
+        self.watch_attempted = False
+        self.last_poll = 0
+        self.scan_tree(root, set())
+        self.watch()
+
+    def scan_dir(self, path):
+        files = []
+        subdirs = []
+        try:
+            mtime = os.path.getmtime(path)
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=True):
+                            if entry.name not in self.excluded_dir_names:
+                                subdirs.append(entry.name)
+                        else:
+                            files.append(entry.name)
+                    except OSError:
+                        continue
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        except OSError:
+            print(f"Warning: Unable to access {path}. Skipping this path.")
+            return None
+        self.dirs[path] = (mtime, files, subdirs)
+        return subdirs
+
+    def scan_tree(self, path, visited):
+        real_path = os.path.realpath(path)
+        if real_path in visited: #symlink loop
+            return
+        visited.add(real_path)
+        subdirs = self.scan_dir(path)
+        if subdirs is None:
+            return
+        for d in subdirs:
+            sub_path = os.path.join(path, d)
+            if sub_path not in self.dirs:
+                self.scan_tree(sub_path, visited)
+
+    def remove_tree(self, path):
+        entry = self.dirs.pop(path, None)
+        if entry is not None:
+            for d in entry[2]:
+                self.remove_tree(os.path.join(path, d))
+
+    def rescan(self, path):
+        old = self.dirs.get(path, None)
+        subdirs = self.scan_dir(path)
+        if subdirs is None:
+            self.remove_tree(path)
+        else:
+            if old is not None:
+                for d in set(old[2]) - set(subdirs):
+                    self.remove_tree(os.path.join(path, d))
+            visited = {os.path.realpath(path)}
+            for d in subdirs:
+                sub_path = os.path.join(path, d)
+                if sub_path not in self.dirs:
+                    self.scan_tree(sub_path, visited)
+        self.version += 1
+        self.files_cache = None
+
+    def changed_dirs(self):
+        out = []
+        for path, entry in self.dirs.items():
+            try:
+                if os.path.getmtime(path) != entry[0]:
+                    out.append(path)
+            except OSError:
+                out.append(path)
+        if self.root not in self.dirs and os.path.isdir(self.root):
+            out.append(self.root)
+        return out
+
+    def refresh(self):
+        with self.lock:
+            if self.observer is None or time.monotonic() - self.last_poll > WATCHER_POLL_INTERVAL:
+                self.last_poll = time.monotonic()
+                changed = self.changed_dirs()
+            else:
+                changed = list(self.dirty)
+            self.dirty.clear()
+            for path in sorted(changed, key=len):
+                if path == self.root or path in self.dirs: #new subdirectories are picked up when their parent is listed again
+                    self.rescan(path)
+            if self.observer is None and not self.watch_attempted:
+                self.watch()
+        return self.version
+
+    def files(self):
+        with self.lock:
+            if self.files_cache is None:
+                out = []
+                for path, entry in self.dirs.items():
+                    rel = os.path.relpath(path, self.root)
+                    if rel == ".":
+                        out.extend(entry[1])
+                    else:
+                        out.extend(os.path.join(rel, f) for f in entry[1])
+                self.files_cache = out
+            return self.files_cache
+
+    def dir_mtimes(self):
+        with self.lock:
+            return {path: entry[0] for path, entry in self.dirs.items()}
+
+    def mark_dirty(self, path):
+        with self.lock:
+            self.dirty.add(path)
+
+    def watch(self):
+        if watchdog_observers is None or not use_filesystem_watcher or not os.path.isdir(self.root):
+            return
+        self.watch_attempted = True
+        index = self
+
+        class Handler(watchdog_events.FileSystemEventHandler):
+            def on_any_event(self, event):
+                for p in (getattr(event, "src_path", None), getattr(event, "dest_path", None)):
+                    if p:
+                        index.mark_dirty(os.path.dirname(p))
+                        if event.is_directory:
+                            index.mark_dirty(p)
+
+        try:
+            observer = watchdog_observers.Observer()
+            observer.daemon = True
+            observer.schedule(Handler(), self.root, recursive=True)
+            observer.start()
+            self.observer = observer
+            self.last_poll = time.monotonic()
+        except Exception as e:
+            print(f"Warning: Unable to watch {self.root}, falling back to polling: {e}")
+
+
+def get_folder_index(directory):
+    global folder_indexes
+    with folder_indexes_lock:
+        index = folder_indexes.get(directory, None)
+        if index is None:
+            index = FolderIndex(directory, excluded_dir_names=[".git"])
+            folder_indexes[directory] = index
+    return index
+
+
 def get_filename_list_(folder_name):
     global folder_names_and_paths
     output_list = set()
     folders = folder_names_and_paths[folder_name]
     output_folders = {}
     for x in folders[0]:
-        files, folders_all = recursive_search(x, excluded_dir_names=[".git"])
-        output_list.update(filter_files_extensions(files, folders[1]))
-        output_folders = {**output_folders, **folders_all}
+        index = get_folder_index(x)
+        index.refresh()
+        output_list.update(filter_files_extensions(index.files(), folders[1]))
+        output_folders = {**output_folders, **index.dir_mtimes()}
 
     return (sorted(list(output_list)), output_folders, time.perf_counter())
 
@@ -210,31 +394,32 @@ def cached_filename_list_(folder_name):
         return None
     out = filename_list_cache[folder_name]
 
-    for x in out[1]:
-        time_modified = out[1][x]
-        folder = x
-        if os.path.getmtime(folder) != time_modified:
-            return None
-
     folders = folder_names_and_paths[folder_name]
-    for x in folders[0]:
-        if os.path.isdir(x):
-            if x not in out[1]:
-                return None
-
+    versions = tuple((x, get_folder_index(x).refresh()) for x in folders[0])
+    if out[3] != versions or out[4] != folders[1]:
+        return None
     return out
 
 
 def get_filename_list(folder_name):
     out = cached_filename_list_(folder_name)
     if out is None:
+        folders = folder_names_and_paths[folder_name]
+        #a copy of the extensions, the set in folder_names_and_paths is modified in place
+        extensions = frozenset(folders[1])
         out = get_filename_list_(folder_name)
+        out = out + (tuple((x, get_folder_index(x).version) for x in folders[0]), extensions)
         global filename_list_cache
         filename_list_cache[folder_name] = out
     return list(out[0])
 
 
-def get_save_image_path(filename_prefix, output_dir, image_width=0, image_height=0):
+#(output folder, filename prefix) -> [next counter, folder mtime], a save only lists the folder when its mtime changed
+#since the last save recorded with save_counter_used (files written by other processes, deleted files...)
+save_counters = {}
+save_counters_lock = threading.Lock()
+
+def get_save_image_path(filename_prefix, output_dir, image_width=0, image_height=0, count=1):
 
     def map_filename(filename):
         prefix_len = len(os.path.basename(filename_prefix))
@@ -265,11 +450,43 @@ def get_save_image_path(filename_prefix, output_dir, image_width=0, image_height
         print(err)
         raise Exception(err)
 
-    try:
-        counter = max(filter(lambda a: a[1][:-1] == filename and a[1][-1] == "_", map(map_filename, os.listdir(full_output_folder))))[0] + 1
-    except ValueError:
-        counter = 1
-    except FileNotFoundError:
-        os.makedirs(full_output_folder, exist_ok=True)
-        counter = 1
+    def scan_counter():
+        try:
+            return max(filter(lambda a: a[1][:-1] == filename and a[1][-1] == "_", map(map_filename, os.listdir(full_output_folder))))[0] + 1
+        except ValueError:
+            return 1
+
+    key = (os.path.abspath(full_output_folder), filename)
+    with save_counters_lock:
+        try:
+            mtime = os.stat(full_output_folder).st_mtime_ns
+        except FileNotFoundError:
+            os.makedirs(full_output_folder, exist_ok=True)
+            mtime = None
+        cached = save_counters.get(key)
+        if cached is not None and cached[1] == mtime:
+            counter = cached[0]
+        else:
+            counter = scan_counter() if mtime is not None else 1
+        # count counters (one per file the caller writes) are reserved so concurrent saves in this process don't overlap
+        save_counters[key] = [counter + max(1, count), mtime]
     return full_output_folder, filename, counter, subfolder, filename_prefix
+
+def save_counter_used(full_output_folder, filename, counter):
+    """Records that a file with counter was written so the next get_save_image_path call skips the directory scan."""
+    key = (os.path.abspath(full_output_folder), filename)
+    with save_counters_lock:
+        cached = save_counters.get(key)
+        if cached is None:
+            return
+        try:
+            cached[1] = os.stat(full_output_folder).st_mtime_ns
+        except OSError:
+            save_counters.pop(key, None)
+            return
+        cached[0] = max(cached[0], counter + 1)
+
+def forget_save_counter(full_output_folder, filename):
+    #the next get_save_image_path call rescans the directory
+    with save_counters_lock:
+        save_counters.pop((os.path.abspath(full_output_folder), filename), None)
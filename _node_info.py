@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import hashlib
+import inspect
+import logging
+import threading
+
+from typing import Dict, Any, Iterable
+
+# node_info / node_info_to_node_dict build the KatUI node dicts of ComfyUI nodes. Since INPUT_TYPES() of loader nodes
+# scans model folders, the dicts are persisted to a cache file keyed by the sources that define the nodes so a warm
+# startup can register them without calling INPUT_TYPES() and the file lists are refreshed in the background instead.
+
+logger = logging.getLogger(__name__) # replaced by KatUI's logger in main.py
+
+
+def node_info(node_class, NODE_CLASS_MAPPINGS: Dict[str, type], NODE_DISPLAY_NAME_MAPPINGS: Dict[str, str]):
+    obj_class = NODE_CLASS_MAPPINGS[node_class]
+    info = {}
+    info['input'] = obj_class.INPUT_TYPES()
+    info['output'] = obj_class.RETURN_TYPES
+    info['output_is_list'] = obj_class.OUTPUT_IS_LIST if hasattr(obj_class, 'OUTPUT_IS_LIST') else [False] * len(obj_class.RETURN_TYPES)
+    info['output_name'] = obj_class.RETURN_NAMES if hasattr(obj_class, 'RETURN_NAMES') else info['output']
+    info['name'] = node_class
+    info['display_name'] = NODE_DISPLAY_NAME_MAPPINGS[node_class] if node_class in NODE_DISPLAY_NAME_MAPPINGS.keys() else node_class
+    info['description'] = obj_class.DESCRIPTION if hasattr(obj_class, 'DESCRIPTION') else ''
+    info['category'] = 'sd'
+    if hasattr(obj_class, 'OUTPUT_NODE') and obj_class.OUTPUT_NODE == True:
+        info['output_node'] = True
+    else:
+        info['output_node'] = False
+
+    if hasattr(obj_class, 'CATEGORY'):
+        info['category'] = obj_class.CATEGORY
+    return info
+
+
+def convert_type(type_original: Any):
+    if type(type_original) == str:
+        return type_original
+    if type(type_original) == list:
+        # if all elements are string, then it is a literal
+        if all(isinstance(x, str) for x in type_original):
+            _type_original = [f"'{x}'" for x in type_original]
+            return f"typing.Literal[{', '.join(_type_original)}]"
+    logger.error(f"Type {type(type_original)} with value{type_original} is not supported. Please report this issue to https://github.com/KokeCacao/KatUI/issues")
+    return "Any"
+
+
+def node_info_to_node_dict(node_str_types: str, node_info: Dict[str, Any], t: type):
+    # constructing input_port_id_to_type
+    required_input_port_id = []
+    required_input_type = []
+    if 'input' in node_info and 'required' in node_info['input']:
+        required_input_port_id = list(node_info['input']['required'].keys())
+        required_input_type = [convert_type(x[0]) for x in node_info['input']['required'].values()]
+
+    optional_input_port_id = []
+    optional_input_type = []
+    if 'input' in node_info and 'optional' in node_info['input']:
+        optional_input_port_id = list(node_info['input']['optional'].keys())
+        optional_input_type = [convert_type(x[0]) for x in node_info['input']['optional'].values()]
+
+    input_port_id = required_input_port_id + optional_input_port_id
+    input_type = required_input_type + optional_input_type
+
+    input_port_id_to_type = dict(zip(input_port_id, input_type))
+
+    # constructing output_port_id_to_type
+    output_type = [a if not b else "<class 'list'>" for a, b in zip(node_info['output'], node_info['output_is_list'])]
+    output_port_id_to_type = dict(zip(node_info['output_name'], output_type))
+    if len(output_port_id_to_type) == 0:
+        # if there is no output, then it is a None type
+        output_port_id_to_type = {"output": "None"}
+
+    # constructing input_port_id_to_default
+    execute_fn = getattr(t, t.FUNCTION)
+    sig = inspect.signature(execute_fn)
+    input_port_id_to_default = {k: v.default for k, v in sig.parameters.items() if v.default is not inspect.Parameter.empty}
+
+    # input_port_id_to_default = {key: None for key in optional_input_port_id}
+
+    return {
+        "node_type": node_str_types,
+        "class_name": node_info['name'], # Not used since they don't have custom UI
+        "display_name": node_info['display_name'],
+        "input_port_id_to_type": input_port_id_to_type,
+        "output_port_id_to_type": output_port_id_to_type,
+        "input_port_id_to_default": input_port_id_to_default,
+        "signal_to_default_data": {},
+        "data": {
+            "hidden": False,
+            "singleton": False,
+            "persistent": False,
+            "inoperable": False,
+        },
+        "inner_types": {}, # I don't need inner types because I assume no args and kwargs
+        "python_path": None, # I am not using it
+        "metadata": {
+            "author": None,
+            "author_url": None,
+            "node_description": node_info['description'],
+            "input_description": {},
+            "output_description": {},
+        },
+        "plugin_name": node_info['category'].replace('/', '.'),
+        "plugin_url": None,
+    }
+
+
+def node_type_name(name: str, t: type):
+    return t.CATEGORY.replace('/', '.') + '.' + name
+
+
+def build_node_dicts(NODE_CLASS_MAPPINGS: Dict[str, type], NODE_DISPLAY_NAME_MAPPINGS: Dict[str, str]):
+    return {node_type_name(name, t): node_info_to_node_dict(node_type_name(name, t), node_info(name, NODE_CLASS_MAPPINGS, NODE_DISPLAY_NAME_MAPPINGS), t) for name, t in NODE_CLASS_MAPPINGS.items()}
+
+
+def source_fingerprint(paths: Iterable[str], node_names: Iterable[str]):
+    h = hashlib.sha256()
+    for path in paths:
+        if os.path.isfile(path):
+            files = [path]
+        else:
+            files = []
+            for root, subdirs, filenames in os.walk(path, followlinks=True):
+                subdirs[:] = sorted(d for d in subdirs if d not in ("__pycache__", ".git"))
+                files += [os.path.join(root, f) for f in sorted(filenames) if os.path.splitext(f)[1] in (".py", ".json", ".txt")]
+        for f in files:
+            try:
+                st = os.stat(f)
+            except OSError:
+                continue
+            h.update(f"{f}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    h.update("\n".join(sorted(node_names)).encode())
+    return h.hexdigest()
+
+
+def load_node_dicts(cache_file: str, fingerprint: str):
+    try:
+        with open(cache_file, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get('fingerprint') != fingerprint:
+        return None
+    return data.get('dicts')
+
+
+def save_node_dicts(cache_file: str, fingerprint: str, dicts: Dict[str, Any]):
+    try:
+        data = json.dumps({'fingerprint': fingerprint, 'dicts': dicts})
+    except (TypeError, ValueError) as e:
+        logger.warning(f"Node dicts can not be cached: {e}")
+        return False
+    tmp_file = cache_file + ".tmp"
+    with open(tmp_file, 'w') as f:
+        f.write(data)
+    os.replace(tmp_file, cache_file)
+    return True
+
+
+def refresh_input_types(dicts: Dict[str, Any], NODE_CLASS_MAPPINGS: Dict[str, type]):
+    # only the input types can change without a source change (choices listing model files)
+    for name, t in NODE_CLASS_MAPPINGS.items():
+        k = node_type_name(name, t)
+        if k not in dicts:
+            continue
+        try:
+            if hasattr(t, 'load_lazy_class'):
+                # a node of a lazily registered pack only knows the input types of the manifest, its choices (model
+                # files...) are stale until the pack is imported
+                t = t.load_lazy_class()
+            input_types = t.INPUT_TYPES()
+        except Exception as e:
+            logger.warning(f"Failed to refresh input types of {k}: {e}")
+            continue
+        input_port_id_to_type = {}
+        for group in ('required', 'optional'):
+            if group in input_types:
+                input_port_id_to_type.update({port: convert_type(x[0]) for port, x in input_types[group].items()})
+        dicts[k]['input_port_id_to_type'] = input_port_id_to_type
+
+
+def load_or_build_node_dicts(cache_file: str, source_paths: Iterable[str], NODE_CLASS_MAPPINGS: Dict[str, type], NODE_DISPLAY_NAME_MAPPINGS: Dict[str, str]):
+    """Returns the node dicts, from the cache when the node sources didn't change.
+
+    On a cache hit the input types are refreshed in a background thread (updating the returned dict in place) and the
+    cache file is rewritten afterwards. When the dicts are built, only the nodes of lazily registered packs are
+    refreshed that way.
+    """
+    time_before = time.perf_counter()
+    fingerprint = source_fingerprint(source_paths, NODE_CLASS_MAPPINGS.keys())
+    dicts = load_node_dicts(cache_file, fingerprint)
+    if dicts is not None and set(dicts.keys()) == set(node_type_name(name, t) for name, t in NODE_CLASS_MAPPINGS.items()):
+        logger.info(f"Loaded {len(dicts)} ComfyUI node dicts from cache in {time.perf_counter() - time_before:.2f} seconds")
+        refresh_mappings = NODE_CLASS_MAPPINGS
+    else:
+        dicts = build_node_dicts(NODE_CLASS_MAPPINGS, NODE_DISPLAY_NAME_MAPPINGS)
+        logger.info(f"Built {len(dicts)} ComfyUI node dicts in {time.perf_counter() - time_before:.2f} seconds")
+        save_node_dicts(cache_file, fingerprint, dicts)
+        refresh_mappings = {name: t for name, t in NODE_CLASS_MAPPINGS.items() if hasattr(t, 'load_lazy_class')}
+
+    if len(refresh_mappings) > 0:
+        def refresh():
+            refresh_input_types(dicts, refresh_mappings)
+            save_node_dicts(cache_file, fingerprint, dicts)
+
+        threading.Thread(target=refresh, daemon=True).start()
+    return dicts
@@ -23,6 +23,9 @@ import comfy.sample
 import comfy.sd
 import comfy.utils
 import comfy.controlnet
+import comfy.model_cache
+import comfy.image_writer
+import comfy.input_image_cache
 
 import comfy.clip_vision
 
@@ -391,22 +394,39 @@ class VAEDecode:
         return (vae.decode(samples["samples"]),)
 
 
+class VAEDecodeStream:
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": {"samples": ("LATENT",), "vae": ("VAE",)}}
+
+    RETURN_TYPES = ("IMAGE_STREAM",)
+    FUNCTION = "decode"
+
+    CATEGORY = "latent"
+
+    def decode(self, vae, samples):
+        return (comfy.sd.DecodeStream(vae, samples["samples"]),)
+
+
 class VAEDecodeTiled:
 
     @classmethod
     def INPUT_TYPES(s):
-        return {"required": {"samples": ("LATENT",), "vae": ("VAE",), "tile_size": ("INT", {"default": 512, "min": 320, "max": 4096, "step": 64})}}
+        return {"required": {"samples": ("LATENT",), "vae": ("VAE",), "tile_size": ("INT", {"default": 512, "min": 320, "max": 4096, "step": 64}),
+                             "mode": (["three_pass", "single_pass"],)}}
 
     RETURN_TYPES = ("IMAGE",)
     FUNCTION = "decode"
 
     CATEGORY = "_for_testing"
 
-    def decode(self, vae, samples, tile_size):
+    def decode(self, vae, samples, tile_size, mode="three_pass"):
         return (vae.decode_tiled(
             samples["samples"],
             tile_x=tile_size // 8,
             tile_y=tile_size // 8,
+            mode=mode,
         ),)
 
 
@@ -430,18 +450,20 @@ class VAEEncodeTiled:
 
     @classmethod
     def INPUT_TYPES(s):
-        return {"required": {"pixels": ("IMAGE",), "vae": ("VAE",), "tile_size": ("INT", {"default": 512, "min": 320, "max": 4096, "step": 64})}}
+        return {"required": {"pixels": ("IMAGE",), "vae": ("VAE",), "tile_size": ("INT", {"default": 512, "min": 320, "max": 4096, "step": 64}),
+                             "mode": (["three_pass", "single_pass"],)}}
 
     RETURN_TYPES = ("LATENT",)
     FUNCTION = "encode"
 
     CATEGORY = "_for_testing"
 
-    def encode(self, vae, pixels, tile_size):
+    def encode(self, vae, pixels, tile_size, mode="three_pass"):
         t = vae.encode_tiled(
             pixels[:, :, :, :3],
             tile_x=tile_size,
             tile_y=tile_size,
+            mode=mode,
         )
         return ({"samples": t},)
 
@@ -687,7 +709,7 @@ class CheckpointLoaderSimple:
 
     def load_checkpoint(self, ckpt_name, output_vae=True, output_clip=True):
         ckpt_path = folder_paths.get_full_path("checkpoints", ckpt_name)
-        out = comfy.sd.load_checkpoint_guess_config(ckpt_path, output_vae=True, output_clip=True, embedding_directory=folder_paths.get_folder_paths("embeddings"))
+        out = comfy.model_cache.load_cached("checkpoint", [ckpt_path], lambda: comfy.sd.load_checkpoint_guess_config(ckpt_path, output_vae=True, output_clip=True, embedding_directory=folder_paths.get_folder_paths("embeddings")))
         return out[:3]
 
 
@@ -733,7 +755,7 @@ class unCLIPCheckpointLoader:
 
     def load_checkpoint(self, ckpt_name, output_vae=True, output_clip=True):
         ckpt_path = folder_paths.get_full_path("checkpoints", ckpt_name)
-        out = comfy.sd.load_checkpoint_guess_config(ckpt_path, output_vae=True, output_clip=True, output_clipvision=True, embedding_directory=folder_paths.get_folder_paths("embeddings"))
+        out = comfy.model_cache.load_cached("checkpoint", [ckpt_path], lambda: comfy.sd.load_checkpoint_guess_config(ckpt_path, output_vae=True, output_clip=True, output_clipvision=True, embedding_directory=folder_paths.get_folder_paths("embeddings")), output_clipvision=True)
         return out
 
 
@@ -814,7 +836,7 @@ class LoraLoader:
             lora = comfy.utils.load_torch_file(lora_path, safe_load=True)
             self.loaded_lora = (lora_path, lora)
 
-        model_lora, clip_lora = comfy.sd.load_lora_for_models(model, clip, lora, strength_model, strength_clip)
+        model_lora, clip_lora = comfy.sd.load_lora_for_models(model, clip, lora, strength_model, strength_clip, lora_id=comfy.model_cache.file_key(lora_path))
         return (model_lora, clip_lora)
 
 
@@ -902,11 +924,12 @@ class VAELoader:
     #TODO: scale factor?
     def load_vae(self, vae_name):
         if vae_name in ["taesd", "taesdxl"]:
-            sd = self.load_taesd(vae_name)
+            approx_vaes = folder_paths.get_filename_list("vae_approx")
+            paths = [folder_paths.get_full_path("vae_approx", v) for v in approx_vaes if v.startswith("{}_encoder.".format(vae_name)) or v.startswith("{}_decoder.".format(vae_name))]
+            vae = comfy.model_cache.load_cached("vae", paths, lambda: comfy.sd.VAE(sd=self.load_taesd(vae_name)))
         else:
             vae_path = folder_paths.get_full_path("vae", vae_name)
-            sd = comfy.utils.load_torch_file(vae_path)
-        vae = comfy.sd.VAE(sd=sd)
+            vae = comfy.model_cache.load_cached("vae", [vae_path], lambda: comfy.sd.VAE(sd=comfy.utils.load_torch_file(vae_path)))
         return (vae,)
 
 
@@ -1026,7 +1049,7 @@ class UNETLoader:
 
     def load_unet(self, unet_name):
         unet_path = folder_paths.get_full_path("unet", unet_name)
-        model = comfy.sd.load_unet(unet_path)
+        model = comfy.model_cache.load_cached("unet", [unet_path], lambda: comfy.sd.load_unet(unet_path))
         return (model,)
 
 
@@ -1052,7 +1075,7 @@ class CLIPLoader:
             clip_type = comfy.sd.CLIPType.STABLE_CASCADE
 
         clip_path = folder_paths.get_full_path("clip", clip_name)
-        clip = comfy.sd.load_clip(ckpt_paths=[clip_path], embedding_directory=folder_paths.get_folder_paths("embeddings"), clip_type=clip_type)
+        clip = comfy.model_cache.load_cached("clip", [clip_path], lambda: comfy.sd.load_clip(ckpt_paths=[clip_path], embedding_directory=folder_paths.get_folder_paths("embeddings"), clip_type=clip_type), clip_type=clip_type.name)
         return (clip,)
 
 
@@ -1075,7 +1098,7 @@ class DualCLIPLoader:
     def load_clip(self, clip_name1, clip_name2):
         clip_path1 = folder_paths.get_full_path("clip", clip_name1)
         clip_path2 = folder_paths.get_full_path("clip", clip_name2)
-        clip = comfy.sd.load_clip(ckpt_paths=[clip_path1, clip_path2], embedding_directory=folder_paths.get_folder_paths("embeddings"))
+        clip = comfy.model_cache.load_cached("clip", [clip_path1, clip_path2], lambda: comfy.sd.load_clip(ckpt_paths=[clip_path1, clip_path2], embedding_directory=folder_paths.get_folder_paths("embeddings")))
         return (clip,)
 
 
@@ -1844,28 +1867,78 @@ class SaveImage:
 
     def save_images(self, images, filename_prefix="ComfyUI", prompt=None, extra_pnginfo=None):
         filename_prefix += self.prefix_append
-        full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir, images[0].shape[1], images[0].shape[0])
         results = list()
-        for (batch_number, image) in enumerate(images):
-            i = 255. * image.cpu().numpy()
-            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-            metadata = None
-            if not args.disable_metadata:
-                metadata = PngInfo()
-                if prompt is not None:
-                    metadata.add_text("prompt", json.dumps(prompt))
-                if extra_pnginfo is not None:
-                    for x in extra_pnginfo:
-                        metadata.add_text(x, json.dumps(extra_pnginfo[x]))
+        writes = list()
+        metadata = None
+        if not args.disable_metadata:
+            metadata = []
+            if prompt is not None:
+                metadata.append(("prompt", json.dumps(prompt)))
+            if extra_pnginfo is not None:
+                for x in extra_pnginfo:
+                    metadata.append((x, json.dumps(extra_pnginfo[x])))
+
+        for (batch_number, image) in enumerate(iter_images(images)):
+            if batch_number == 0:
+                # one counter per image, a DecodeStream knows its length before it is decoded
+                count = len(images)
+                full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir, image.shape[1], image.shape[0], count)
 
             filename_with_batch_num = filename.replace("%batch_num%", str(batch_number))
             file = f"{filename_with_batch_num}_{counter:05}_.png"
-            img.save(os.path.join(full_output_folder, file), pnginfo=metadata, compress_level=self.compress_level)
+            # compressed and written in the background while the next images are converted
+            writes.append(comfy.image_writer.submit(comfy.image_writer.to_pixels(image), os.path.join(full_output_folder, file), metadata, self.compress_level, exclusive=True))
             results.append({"filename": file, "subfolder": subfolder, "type": self.type})
             counter += 1
 
+        # the images are on disk once the node is done, a failed write is raised after all the others finished
+        error = None
+        for batch_number, write in enumerate(writes):
+            try:
+                write.result()
+            except FileExistsError as e:
+                results[batch_number]["filename"] = self.move_to_free_name(e.filename, full_output_folder, filename, filename_prefix, batch_number)
+            except Exception as e:
+                if error is None:
+                    error = e
+        if len(results) > 0:
+            folder_paths.save_counter_used(full_output_folder, filename, counter - 1)
+        if error is not None:
+            raise error
         return {"ui": {"images": results}}
 
+    def move_to_free_name(self, tmp_path, full_output_folder, filename, filename_prefix, batch_number):
+        # another process saved a file with the same name, give the written image the next free counter
+        while True:
+            folder_paths.forget_save_counter(full_output_folder, filename)
+            full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir)
+            file = f"{filename.replace('%batch_num%', str(batch_number))}_{counter:05}_.png"
+            try:
+                comfy.image_writer.link_exclusive(tmp_path, os.path.join(full_output_folder, file))
+            except FileExistsError:
+                continue
+            folder_paths.save_counter_used(full_output_folder, filename, counter)
+            return file
+
+
+def iter_images(images):
+    #images is an IMAGE tensor or an IMAGE_STREAM yielding sub-batches of them
+    if isinstance(images, torch.Tensor):
+        yield from images
+    else:
+        for batch in images:
+            yield from batch
+
+
+class SaveImageStream(SaveImage):
+    # SaveImage consuming an IMAGE_STREAM, images are written while the rest of the batch is still being decoded
+
+    @classmethod
+    def INPUT_TYPES(s):
+        input_types = SaveImage.INPUT_TYPES()
+        input_types["required"]["images"] = ("IMAGE_STREAM",)
+        return input_types
+
 
 class PreviewImage(SaveImage):
 
@@ -1909,6 +1982,9 @@ class LoadImage:
 
     def load_image(self, image):
         image_path = folder_paths.get_annotated_filepath(image)
+        return comfy.input_image_cache.load(image_path, "LoadImage", lambda: self.decode_image(image_path))
+
+    def decode_image(self, image_path):
         img = Image.open(image_path)
         output_images = []
         output_masks = []
@@ -1941,10 +2017,7 @@ class LoadImage:
     @classmethod
     def IS_CHANGED(s, image):
         image_path = folder_paths.get_annotated_filepath(image)
-        m = hashlib.sha256()
-        with open(image_path, 'rb') as f:
-            m.update(f.read())
-        return m.digest().hex()
+        return comfy.input_image_cache.sha256(image_path)
 
     @classmethod
     def VALIDATE_INPUTS(s, image):
@@ -1977,6 +2050,9 @@ class LoadImageMask:
 
     def load_image(self, image, channel):
         image_path = folder_paths.get_annotated_filepath(image)
+        return comfy.input_image_cache.load(image_path, ("LoadImageMask", channel), lambda: self.decode_mask(image_path, channel))
+
+    def decode_mask(self, image_path, channel):
         i = Image.open(image_path)
         i = ImageOps.exif_transpose(i)
         if i.getbands() != ("R", "G", "B", "A"):
@@ -1997,10 +2073,7 @@ class LoadImageMask:
     @classmethod
     def IS_CHANGED(s, image, channel):
         image_path = folder_paths.get_annotated_filepath(image)
-        m = hashlib.sha256()
-        with open(image_path, 'rb') as f:
-            m.update(f.read())
-        return m.digest().hex()
+        return comfy.input_image_cache.sha256(image_path)
 
     @classmethod
     def VALIDATE_INPUTS(s, image):
@@ -2245,6 +2318,7 @@ NODE_CLASS_MAPPINGS = {
     "CLIPTextEncode": CLIPTextEncode,
     "CLIPSetLastLayer": CLIPSetLastLayer,
     "VAEDecode": VAEDecode,
+    "VAEDecodeStream": VAEDecodeStream,
     "VAEEncode": VAEEncode,
     "VAEEncodeForInpaint": VAEEncodeForInpaint,
     "VAELoader": VAELoader,
@@ -2254,6 +2328,7 @@ NODE_CLASS_MAPPINGS = {
     "LatentFromBatch": LatentFromBatch,
     "RepeatLatentBatch": RepeatLatentBatch,
     "SaveImage": SaveImage,
+    "SaveImageStream": SaveImageStream,
     "PreviewImage": PreviewImage,
     "LoadImage": LoadImage,
     "LoadImageMask": LoadImageMask,
@@ -2337,6 +2412,7 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     "VAEEncodeForInpaint": "VAE Encode (for Inpainting)",
     "SetLatentNoiseMask": "Set Latent Noise Mask",
     "VAEDecode": "VAE Decode",
+    "VAEDecodeStream": "VAE Decode (Stream)",
     "VAEEncode": "VAE Encode",
     "LatentRotate": "Rotate Latent",
     "LatentFlip": "Flip Latent",
@@ -2350,6 +2426,7 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     "RepeatLatentBatch": "Repeat Latent Batch",
     # Image
     "SaveImage": "Save Image",
+    "SaveImageStream": "Save Image (Stream)",
     "PreviewImage": "Preview Image",
     "LoadImage": "Load Image",
     "LoadImageMask": "Load Image (as Mask)",
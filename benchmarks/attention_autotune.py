@@ -0,0 +1,46 @@
+#Prints the time of every cross attention implementation the autotuner picks from for typical SD1.5/SDXL attention
+#shapes on the CPU, and the one it would pick.
+#usage: python benchmarks/attention_autotune.py [--batch 2] [--repeat 3]
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+import torch
+from comfy.cli_args import args as comfy_args
+comfy_args.cpu = True
+
+import comfy.attention_autotune
+import comfy.ldm.modules.attention
+
+#(heads, dim_head, q_len, k_len)
+SHAPES = [
+    (8, 40, 4096, 4096),
+    (8, 40, 4096, 77),
+    (8, 80, 1024, 1024),
+    (8, 80, 1024, 77),
+    (8, 160, 256, 256),
+    (8, 160, 256, 77),
+    (8, 160, 64, 64),
+    (10, 64, 4096, 4096),
+    (20, 64, 1024, 77),
+]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=3)
+    a = parser.parse_args()
+
+    torch.manual_seed(0)
+    backends = comfy.ldm.modules.attention.autotune_backends()
+    names = list(backends.keys())
+    print("{:>5} {:>4} {:>6} {:>6} ".format("heads", "dim", "q_len", "k_len") + " ".join("{:>13}".format(n) for n in names) + "  winner")
+    for heads, dim_head, q_len, k_len in SHAPES:
+        q = torch.randn(a.batch, q_len, heads * dim_head)
+        k = torch.randn(a.batch, k_len, heads * dim_head)
+        v = torch.randn(a.batch, k_len, heads * dim_head)
+        times = comfy.attention_autotune.benchmark(backends, q, k, v, heads, repeat=a.repeat)
+        row = " ".join("{:>11.2f}ms".format(times[n] * 1000) if n in times else "{:>13}".format("failed") for n in names)
+        print("{:>5} {:>4} {:>6} {:>6} ".format(heads, dim_head, q_len, k_len) + row + "  " + min(times, key=times.get))
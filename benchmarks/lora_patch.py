@@ -0,0 +1,56 @@
+#Measures ModelPatcher.patch_model time for a synthetic lora on the CPU, with and without batched merging.
+#usage: python benchmarks/lora_patch.py [--keys 1000] [--rank 8] [--repeat 5]
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+import torch
+from comfy.cli_args import args as comfy_args
+comfy_args.cpu = True
+
+import comfy.model_patcher
+import comfy.lora_merge
+
+SHAPES = [(320, 320), (640, 640), (640, 2560), (1280, 1280), (320, 768)]
+
+def build(keys, rank):
+    model = torch.nn.Module()
+    model.layers = torch.nn.ModuleList([torch.nn.Linear(*reversed(SHAPES[i % len(SHAPES)]), bias=False) for i in range(keys)])
+    patches = {}
+    for i, layer in enumerate(model.layers):
+        out_features, in_features = layer.weight.shape
+        patches["layers.{}.weight".format(i)] = ("lora", (torch.randn(out_features, rank) * 0.01, torch.randn(rank, in_features) * 0.01, float(rank), None))
+    patcher = comfy.model_patcher.ModelPatcher(model, load_device=torch.device("cpu"), offload_device=torch.device("cpu"))
+    patcher.add_patches(patches, 1.0)
+    return patcher
+
+def measure(patcher, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        patcher.patch_model()
+        times.append(time.perf_counter() - start)
+        patcher.unpatch_model()
+    return min(times)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=1000)
+    parser.add_argument("--rank", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5)
+    a = parser.parse_args()
+
+    torch.manual_seed(0)
+    patcher = build(a.keys, a.rank)
+
+    comfy.lora_merge.batched_merge_enabled = False
+    per_key = measure(patcher, a.repeat)
+    comfy.lora_merge.batched_merge_enabled = True
+    batched = measure(patcher, a.repeat)
+
+    print("{} keys, rank {}".format(a.keys, a.rank))
+    print("per key merge: {:8.3f} s".format(per_key))
+    print("batched merge: {:8.3f} s ({:.2f}x)".format(batched, per_key / batched))
@@ -0,0 +1,50 @@
+#Measures how long building the KatUI node dicts of the builtin ComfyUI nodes takes cold and from the node info cache.
+#usage: python benchmarks/node_info_startup.py [--repeat 5]
+import os
+import sys
+import time
+import tempfile
+import argparse
+import importlib.util
+
+root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+sys.path.insert(0, root)
+
+from comfy.cli_args import args as comfy_args
+comfy_args.cpu = True
+
+def load_module(module_name, module_path):
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+load_module("folder_paths", os.path.join(root, "_folder_paths.py"))
+load_module("latent_preview", os.path.join(root, "_latent_preview.py"))
+nodes = load_module("nodes", os.path.join(root, "_nodes.py"))
+import _node_info
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    a = parser.parse_args()
+
+    source_paths = [os.path.join(root, x) for x in ("main.py", "_nodes.py", "_folder_paths.py", "comfy", "comfy_extras")]
+    with tempfile.TemporaryDirectory() as d:
+        cache_file = os.path.join(d, "node_info_cache.json")
+        cold = []
+        warm = []
+        for _ in range(a.repeat):
+            if os.path.exists(cache_file):
+                os.remove(cache_file)
+            start = time.perf_counter()
+            _node_info.load_or_build_node_dicts(cache_file, source_paths, nodes.NODE_CLASS_MAPPINGS, nodes.NODE_DISPLAY_NAME_MAPPINGS)
+            cold.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            _node_info.load_or_build_node_dicts(cache_file, source_paths, nodes.NODE_CLASS_MAPPINGS, nodes.NODE_DISPLAY_NAME_MAPPINGS)
+            warm.append(time.perf_counter() - start)
+
+    print("{} nodes".format(len(nodes.NODE_CLASS_MAPPINGS)))
+    print("cold build: {:8.3f} s".format(min(cold)))
+    print("warm cache: {:8.3f} s ({:.2f}x)".format(min(warm), min(cold) / min(warm)))
@@ -0,0 +1,48 @@
+#Compares comfy.utils.tiled_scale running a small conv upscaler one tile at a time and with batched tiles on the CPU.
+#usage: python benchmarks/tiled_scale.py [--size 512] [--tile 64] [--batch 8] [--repeat 3]
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+import torch
+import comfy.utils
+
+def build_net(width=32, scale=2):
+    return torch.nn.Sequential(
+        torch.nn.Conv2d(3, width, 3, padding=1), torch.nn.ReLU(),
+        torch.nn.Conv2d(width, width, 3, padding=1), torch.nn.ReLU(),
+        torch.nn.Conv2d(width, 3 * scale * scale, 3, padding=1),
+        torch.nn.PixelShuffle(scale),
+    ).eval()
+
+def measure(image, net, tile, tile_batch, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = comfy.utils.tiled_scale(image, net, tile_x=tile, tile_y=tile, overlap=8, upscale_amount=2, tile_batch=tile_batch)
+        times.append(time.perf_counter() - start)
+    return min(times), out
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--tile", type=int, default=64)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    a = parser.parse_args()
+
+    torch.manual_seed(0)
+    net = build_net()
+    image = torch.rand(1, 3, a.size, a.size)
+    tiles = comfy.utils.get_tiled_scale_steps(a.size, a.size, a.tile, a.tile, 8)
+
+    per_tile, out_per_tile = measure(image, net, a.tile, 1, a.repeat)
+    batched, out_batched = measure(image, net, a.tile, a.batch, a.repeat)
+
+    print("{}x{} image, {} tiles of {}".format(a.size, a.size, tiles, a.tile))
+    print("per tile:       {:8.3f} s ({:7.1f} tiles/s)".format(per_tile, tiles / per_tile))
+    print("batched ({:2d}):   {:8.3f} s ({:7.1f} tiles/s, {:.2f}x)".format(a.batch, batched, tiles / batched, per_tile / batched))
+    print("max abs difference: {:.2e}".format((out_per_tile - out_batched).abs().max().item()))
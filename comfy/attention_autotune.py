@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import logging
+import threading
+import torch
+import folder_paths
+
+import comfy.model_management
+from comfy.cli_args import args
+
+#Picks the fastest attention implementation per (device, dtype, batch, heads, dim_head, q_len, k_len, mask) bucket.
+#The first call that falls in a bucket runs every implementation on its own inputs, the winner is kept in a json file
+#so the benchmark only happens once per machine.
+
+enabled = args.attention_autotune
+
+if args.attention_autotune_cache is not None:
+    cache_file = args.attention_autotune_cache
+else:
+    cache_file = os.path.join(folder_paths.get_cache_directory(), "attention_autotune.json")
+
+BENCHMARK_REPEAT = 2
+
+def bucket(n):
+    return 1 << max(0, (n - 1).bit_length())
+
+def device_name(device):
+    if device.type == "cuda":
+        return "{}:{}".format(device, torch.cuda.get_device_name(device))
+    return str(device)
+
+def shape_key(q, k, heads, mask=None):
+    b, q_tokens, inner_dim = q.shape
+    return "{}|{}|b{}|h{}|d{}|q{}|k{}|{}".format(device_name(q.device), q.dtype, bucket(b), heads, inner_dim // heads, bucket(q_tokens), bucket(k.shape[1]), "mask" if mask is not None else "nomask")
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+def benchmark(backends, q, k, v, heads, mask=None, repeat=BENCHMARK_REPEAT):
+    times = {}
+    with torch.no_grad():
+        for name, fn in backends.items():
+            try:
+                fn(q, k, v, heads, mask=mask)
+                synchronize(q.device)
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    fn(q, k, v, heads, mask=mask)
+                synchronize(q.device)
+                times[name] = (time.perf_counter() - start) / repeat
+            except Exception as e:
+                if isinstance(e, comfy.model_management.OOM_EXCEPTION):
+                    comfy.model_management.soft_empty_cache(True)
+                logging.debug("attention autotune: {} failed: {}".format(name, e))
+    return times
+
+class AttentionAutotuner:
+    def __init__(self, backends, cache_file=None):
+        self.backends = backends
+        self.cache_file = cache_file
+        self.winners = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        self.winners = {}
+        if self.cache_file is not None and os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file) as f:
+                    self.winners = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning("could not load attention autotune results {}: {}".format(self.cache_file, e))
+
+    def save(self):
+        if self.cache_file is None:
+            return
+        try:
+            with open(self.cache_file + ".tmp", "w") as f:
+                json.dump(self.winners, f, indent=1, sort_keys=True)
+            os.replace(self.cache_file + ".tmp", self.cache_file)
+        except OSError as e:
+            logging.warning("could not save attention autotune results {}: {}".format(self.cache_file, e))
+
+    def select(self, q, k, v, heads, mask=None):
+        key = shape_key(q, k, heads, mask)
+        with self.lock:
+            if self.winners is None:
+                self.load()
+            name = self.winners.get(key, None)
+            if name not in self.backends:
+                times = benchmark(self.backends, q, k, v, heads, mask)
+                if len(times) == 0:
+                    raise RuntimeError("attention autotune: no attention implementation works for {}".format(key))
+                name = min(times, key=times.get)
+                self.winners[key] = name
+                self.save()
+                logging.info("attention autotune {}: {} ({})".format(key, name, ", ".join("{} {:.2f}ms".format(n, t * 1000) for n, t in sorted(times.items(), key=lambda x: x[1]))))
+        return self.backends[name]
@@ -0,0 +1,41 @@
+import torch
+
+import comfy.utils
+
+#Merges the unets of two checkpoint files straight into an output file: the tensors are read one key at a time from
+#the memory mapped sources, merged and written with comfy.utils.SafetensorsWriter so that memory use stays around
+#the size of the largest tensor instead of holding the two models and the merged one.
+
+UNET_PREFIX = "model.diffusion_model."
+
+def block_ratio(k_unet, ratios, default_ratio):
+    #ratio of the longest block prefix in ratios matching the unet key, like ModelMergeBlocks
+    ratio = default_ratio
+    last_arg_size = 0
+    for arg in ratios:
+        if k_unet.startswith(arg) and last_arg_size < len(arg):
+            ratio = ratios[arg]
+            last_arg_size = len(arg)
+    return ratio
+
+def merge_checkpoints(output_path, ckpt_path1, ckpt_path2, ratio_function, metadata=None):
+    """ratio_function(unet key) returns how much of the first checkpoint is kept in the unet weight (same meaning as
+    the ratio of ModelMergeSimple), every other weight (clip, vae...) is copied from the first checkpoint."""
+    sd1 = comfy.utils.load_torch_file(ckpt_path1, safe_load=True, lazy=True)
+    sd2 = comfy.utils.load_torch_file(ckpt_path2, safe_load=True, lazy=True)
+
+    tensors = [(k, comfy.utils.state_dict_shape(sd1, k), comfy.utils.state_dict_dtype(sd1, k)) for k in sd1.keys()]
+    merged = 0
+    with comfy.utils.SafetensorsWriter(output_path, tensors, metadata) as writer:
+        for k, k_shape, k_dtype in tensors:
+            w = sd1[k]
+            if k.startswith(UNET_PREFIX) and k in sd2 and comfy.utils.state_dict_shape(sd2, k) == k_shape and w.is_floating_point():
+                ratio = ratio_function(k[len(UNET_PREFIX):])
+                if ratio != 1.0:
+                    w2 = sd2[k]
+                    w = torch.lerp(w2.float(), w.float(), ratio)
+                    del w2
+                    merged += 1
+            writer.write(k, w)
+            del w
+    return merged
@@ -91,6 +91,8 @@ attn_group = parser.add_mutually_exclusive_group()
 attn_group.add_argument("--use-split-cross-attention", action="store_true", help="Use the split cross attention optimization. Ignored when xformers is used.")
 attn_group.add_argument("--use-quad-cross-attention", action="store_true", help="Use the sub-quadratic cross attention optimization . Ignored when xformers is used.")
 attn_group.add_argument("--use-pytorch-cross-attention", action="store_true", help="Use the new pytorch 2.0 cross attention function.")
+attn_group.add_argument("--attention-autotune", action="store_true", help="Benchmark the available cross attention implementations the first time an attention shape is seen and use the fastest one for it.")
+parser.add_argument("--attention-autotune-cache", type=str, default=None, metavar="PATH", help="File the --attention-autotune results are kept in (default: attention_autotune.json in the user/cache directory).")
 
 parser.add_argument("--disable-xformers", action="store_true", help="Disable xformers.")
 
@@ -104,6 +106,16 @@ vram_group.add_argument("--cpu", action="store_true", help="To use the CPU for e
 
 
 parser.add_argument("--disable-smart-memory", action="store_true", help="Force ComfyUI to agressively offload to regular ram instead of keeping models in vram when it can.")
+parser.add_argument("--model-cache-ram", type=float, default=0.0, metavar="GB", help="RAM budget in GB for keeping loaded checkpoints, VAEs, CLIPs and UNETs around so they can be reused without reloading them from disk. Disabled (0) by default, the cached models stay in RAM on top of the models in use.")
+parser.add_argument("--lora-weight-cache-ram", type=float, default=0.0, metavar="GB", help="RAM budget in GB for caching weights merged with loras so the same lora stack doesn't need to be merged again. Disabled (0) by default, the cached weights stay in RAM on top of the loaded models.")
+parser.add_argument("--lora-weight-cache-dir", type=str, default=None, metavar="PATH", help="Spill merged lora weights evicted from the RAM cache to this directory.")
+parser.add_argument("--lora-weight-cache-disk-size", type=float, default=16.0, metavar="GB", help="Maximum size in GB of the merged lora weights spilled to --lora-weight-cache-dir.")
+parser.add_argument("--input-image-cache-ram", type=float, default=1.0, metavar="GB", help="RAM budget in GB for keeping the hashes and decoded tensors of the images loaded by LoadImage and LoadImageMask, 0 disables the cache.")
+parser.add_argument("--tokenizer-cache-size", type=int, default=4096, metavar="PROMPTS", help="Number of tokenized prompts each tokenizer keeps so the same prompt isn't parsed and tokenized again, 0 disables the cache.")
+parser.add_argument("--controlnet-hint-cache-size", type=float, default=256.0, metavar="MB", help="RAM budget in MB for keeping controlnet hint images resized across sampling runs, 0 disables the cache.")
+parser.add_argument("--disable-batched-lora-merge", action="store_true", help="Merge lora weights one key at a time instead of batching keys with the same shapes.")
+parser.add_argument("--unmerged-lora", action="store_true", help="Apply loras as low rank adapters in the forward of the model layers instead of merging them into the weights, makes switching loras cheap.")
+parser.add_argument("--counter-noise", action="store_true", help="Generate the initial noise and the SDE sampler noise with counter based generators instead of the sequential torch generator and torchsde Brownian trees, the noise of each latent only depends on the seed and its batch index and is generated for the whole batch at once. Seeds give different images than with the default generators.")
 parser.add_argument("--deterministic", action="store_true", help="Make pytorch use slower deterministic algorithms when it can. Note that this might not make images deterministic in all cases.")
 
 parser.add_argument("--dont-print-server", action="store_true", help="Don't print server output.")
@@ -111,6 +123,11 @@ parser.add_argument("--quick-test-for-ci", action="store_true", help="Quick test
 parser.add_argument("--windows-standalone-build", action="store_true", help="Windows standalone build: Enable convenient things that most people using the standalone windows build will probably enjoy (like auto opening the page on startup).")
 
 parser.add_argument("--disable-metadata", action="store_true", help="Disable saving prompt metadata in files.")
+parser.add_argument("--image-writer-workers", type=int, default=None, metavar="N", help="Number of workers compressing and writing the images of SaveImage/PreviewImage in the background (default: up to 4), 0 writes them on the executing thread.")
+parser.add_argument("--image-writer-processes", action="store_true", help="Use processes instead of threads for the image writer workers.")
+parser.add_argument("--lazy-custom-nodes", action="store_true", help="Register custom node packs from a manifest captured on their first import and only import a pack when one of its nodes is executed.")
+parser.add_argument("--parallel-custom-nodes", type=str, default=[], metavar="NAME", nargs="+", help="Custom node packs (directory or file names in custom_nodes) that are safe to import in parallel with the others.")
+parser.add_argument("--custom-node-import-workers", type=int, default=4, metavar="N", help="Number of threads used to import the --parallel-custom-nodes packs.")
 
 parser.add_argument("--multi-user", action="store_true", help="Enables per-user storage.")
 
@@ -1,4 +1,4 @@
-from .utils import load_torch_file, transformers_convert, state_dict_prefix_replace
+from .utils import load_torch_file, transformers_convert, state_dict_prefix_replace, move_state_dict_key
 import os
 import torch
 import json
@@ -74,7 +74,7 @@ def convert_to_transformers(sd, prefix):
 
         for x in keys_to_replace:
             if x in sd_k:
-                sd[keys_to_replace[x]] = sd.pop(x)
+                move_state_dict_key(sd, x, keys_to_replace[x])
 
         if "{}proj".format(prefix) in sd_k:
             sd['visual_projection.weight'] = sd.pop("{}proj".format(prefix)).transpose(0, 1)
@@ -105,8 +105,7 @@ def load_clipvision_from_sd(sd, prefix="", convert_keys=False):
     keys = list(sd.keys())
     for k in keys:
         if k not in u:
-            t = sd.pop(k)
-            del t
+            del sd[k]
     return clip
 
 def load(ckpt_path):
@@ -2,11 +2,13 @@ import torch
 import math
 import os
 import logging
+import weakref
 import comfy.utils
 import comfy.model_management
 import comfy.model_detection
 import comfy.model_patcher
 import comfy.ops
+from comfy.cli_args import args
 
 import comfy.cldm.cldm
 import comfy.t2i_adapter.adapter
@@ -31,6 +33,29 @@ def broadcast_image_to(tensor, target_batch_size, batched_number):
     else:
         return torch.cat([tensor] * batched_number, dim=0)
 
+def hint_size(value):
+    return value[1].nelement() * value[1].element_size()
+
+#resized and cast hints kept on the CPU across sampling runs so unchanged hint images are only prepared once, only
+#the copy to the device is done for every run
+hint_cache = comfy.utils.LRUCache(int(args.controlnet_hint_cache_size * 1024 * 1024), hint_size)
+
+def prepare_hint(image, width, height, upscale_algorithm, dtype, device, batch_size, batched_number, channels=None):
+    #the entry holds a weak reference to the hint image, a new image that gets the id of a freed one doesn't match it
+    #_version changes when the image is modified in place, inference tensors don't track it
+    version = -1 if image.is_inference() else image._version
+    key = (id(image), version, width, height, upscale_algorithm, dtype, batch_size, batched_number, channels)
+    cached = hint_cache.get(key)
+    if cached is not None and cached[0]() is image:
+        return cached[1].to(device)
+    hint = comfy.utils.common_upscale(image, width, height, upscale_algorithm, "center").to(dtype)
+    if channels == 1 and hint.shape[1] > 1:
+        hint = torch.mean(hint, 1, keepdim=True)
+    if batch_size != hint.shape[0]:
+        hint = broadcast_image_to(hint, batch_size, batched_number)
+    hint_cache.put(key, (weakref.ref(image), hint.to("cpu")))
+    return hint.to(device)
+
 class ControlBase:
     def __init__(self, device=None):
         self.cond_hint_original = None
@@ -164,13 +189,8 @@ class ControlNet(ControlBase):
             dtype = self.manual_cast_dtype
 
         output_dtype = x_noisy.dtype
-        if self.cond_hint is None or x_noisy.shape[2] * self.compression_ratio != self.cond_hint.shape[2] or x_noisy.shape[3] * self.compression_ratio != self.cond_hint.shape[3]:
-            if self.cond_hint is not None:
-                del self.cond_hint
-            self.cond_hint = None
-            self.cond_hint = comfy.utils.common_upscale(self.cond_hint_original, x_noisy.shape[3] * self.compression_ratio, x_noisy.shape[2] * self.compression_ratio, self.upscale_algorithm, "center").to(dtype).to(self.device)
-        if x_noisy.shape[0] != self.cond_hint.shape[0]:
-            self.cond_hint = broadcast_image_to(self.cond_hint, x_noisy.shape[0], batched_number)
+        if self.cond_hint is None or x_noisy.shape[2] * self.compression_ratio != self.cond_hint.shape[2] or x_noisy.shape[3] * self.compression_ratio != self.cond_hint.shape[3] or self.cond_hint.shape[0] not in (1, x_noisy.shape[0]):
+            self.cond_hint = prepare_hint(self.cond_hint_original, x_noisy.shape[3] * self.compression_ratio, x_noisy.shape[2] * self.compression_ratio, self.upscale_algorithm, dtype, self.device, x_noisy.shape[0], batched_number)
 
         context = cond.get('crossattn_controlnet', cond['c_crossattn'])
         y = cond.get('y', None)
@@ -469,17 +489,12 @@ class T2IAdapter(ControlBase):
                 else:
                     return None
 
-        if self.cond_hint is None or x_noisy.shape[2] * self.compression_ratio != self.cond_hint.shape[2] or x_noisy.shape[3] * self.compression_ratio != self.cond_hint.shape[3]:
-            if self.cond_hint is not None:
-                del self.cond_hint
-            self.control_input = None
-            self.cond_hint = None
-            width, height = self.scale_image_to(x_noisy.shape[3] * self.compression_ratio, x_noisy.shape[2] * self.compression_ratio)
-            self.cond_hint = comfy.utils.common_upscale(self.cond_hint_original, width, height, self.upscale_algorithm, "center").float().to(self.device)
-            if self.channels_in == 1 and self.cond_hint.shape[1] > 1:
-                self.cond_hint = torch.mean(self.cond_hint, 1, keepdim=True)
-        if x_noisy.shape[0] != self.cond_hint.shape[0]:
-            self.cond_hint = broadcast_image_to(self.cond_hint, x_noisy.shape[0], batched_number)
+        width, height = self.scale_image_to(x_noisy.shape[3] * self.compression_ratio, x_noisy.shape[2] * self.compression_ratio)
+        if self.cond_hint is None or height != self.cond_hint.shape[2] or width != self.cond_hint.shape[3] or self.cond_hint.shape[0] not in (1, x_noisy.shape[0]):
+            cond_hint = prepare_hint(self.cond_hint_original, width, height, self.upscale_algorithm, torch.float32, self.device, x_noisy.shape[0], batched_number, self.channels_in)
+            if cond_hint is not self.cond_hint:
+                self.control_input = None
+            self.cond_hint = cond_hint
         if self.control_input is None:
             self.t2i_model.to(x_noisy.dtype)
             self.t2i_model.to(self.device)
@@ -0,0 +1,50 @@
+import math
+import torch
+
+#Counter based random numbers (Philox 4x32-10): the value at a counter only depends on the counter and the key (seed)
+#so any subset of a stream can be generated directly, in one vectorized call, in any order.
+
+PHILOX_M = (0xD2511F53, 0xCD9E8D57)
+PHILOX_W = (0x9E3779B9, 0xBB67AE85)
+MASK32 = 0xffffffff
+
+def mulhilo(a, b):
+    #a is a 32 bit constant, b an int64 tensor of 32 bit values, the int64 product wraps but its bits are exact
+    p = b * a
+    return (p >> 32) & MASK32, p & MASK32
+
+def philox4x32(c0, c1, c2, c3, k0, k1, rounds=10):
+    for _ in range(rounds):
+        hi0, lo0 = mulhilo(PHILOX_M[0], c0)
+        hi1, lo1 = mulhilo(PHILOX_M[1], c2)
+        c0, c1, c2, c3 = hi1 ^ c1 ^ k0, lo1, hi0 ^ c3 ^ k1, lo0
+        k0 = (k0 + PHILOX_W[0]) & MASK32
+        k1 = (k1 + PHILOX_W[1]) & MASK32
+    return c0, c1, c2, c3
+
+#the top bits of the c3 counter word tell the consumers apart so they never draw the same numbers for the same seed
+STREAM_NOISE = 0 << 28 #initial noise of comfy.sample.prepare_noise, c3 = 0
+STREAM_BROWNIAN = 1 << 28 #Brownian tree nodes of the SDE samplers
+
+def seed_tensor(seeds, device="cpu"):
+    #64 bit seeds as int64 (seeds above 2**63 wrap to negative values, their bits are kept)
+    seeds = [(s & 0xffffffffffffffff) - (1 << 64) if (s & 0xffffffffffffffff) >= (1 << 63) else s for s in seeds]
+    return torch.tensor(seeds, dtype=torch.int64, device=device).unsqueeze(1)
+
+def randn(n, seeds, c2, c3=0, dtype=torch.float64):
+    """Returns [rows, n] standard normal samples, row i is keyed by seeds[i] (int64 tensor of shape [rows, 1], see
+    seed_tensor) and the counter words c2, c3 (ints or int64 tensors broadcastable to [rows, 1])."""
+    m = (n + 3) // 4
+    device = seeds.device
+    element = torch.arange(m, dtype=torch.int64, device=device).unsqueeze(0)
+    c2 = torch.as_tensor(c2, dtype=torch.int64, device=device)
+    c3 = torch.as_tensor(c3, dtype=torch.int64, device=device)
+    c = torch.broadcast_tensors(element & MASK32, (element >> 32) & MASK32, c2 & MASK32, c3 & MASK32, seeds)
+    x = philox4x32(c[0], c[1], c[2], c[3], seeds & MASK32, (seeds >> 32) & MASK32)
+    u = [(v.to(dtype) + 0.5) * (2.0 ** -32) for v in x]
+    out = []
+    for u1, u2 in ((u[0], u[1]), (u[2], u[3])):
+        r = torch.sqrt(-2.0 * torch.log(u1))
+        theta = (2.0 * math.pi) * u2
+        out += [r * torch.cos(theta), r * torch.sin(theta)]
+    return torch.stack(out, dim=-1).reshape(out[0].shape[0], -1)[:, :n]
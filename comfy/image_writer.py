@@ -0,0 +1,137 @@
+import os
+import errno
+import logging
+import threading
+import multiprocessing
+import concurrent.futures
+import numpy as np
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+
+from comfy.cli_args import args
+
+#PNG compression of SaveImage/PreviewImage runs on a pool of workers so a batch is compressed in parallel instead of
+#one image after the other on the executing thread. Files are written to a temporary name, fsynced and renamed so
+#a file that exists under its final name is complete. With exclusive=True an existing file is never replaced, the
+#write fails with FileExistsError instead so concurrent savers can't overwrite each other's outputs.
+
+def to_pixels(image):
+    return np.clip(255. * image.cpu().numpy(), 0, 255).astype(np.uint8)
+
+def link_exclusive(tmp_path, path):
+    try:
+        os.link(tmp_path, path)
+    except FileExistsError:
+        raise
+    except OSError:
+        #no hard links on this filesystem, claim the name with an empty file first
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        os.replace(tmp_path, path)
+        return
+    os.remove(tmp_path)
+
+def remove_tmp(tmp_path):
+    try:
+        os.remove(tmp_path)
+    except OSError:
+        pass
+
+def write_png(pixels, path, text=None, compress_level=4, exclusive=False):
+    metadata = None
+    if text is not None:
+        metadata = PngInfo()
+        for k, v in text:
+            metadata.add_text(k, v)
+    tmp_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+    try:
+        with open(tmp_path, "wb") as f:
+            Image.fromarray(pixels).save(f, format="PNG", pnginfo=metadata, compress_level=compress_level)
+            f.flush()
+            os.fsync(f.fileno())
+        if not exclusive:
+            os.replace(tmp_path, path)
+            return path
+    except BaseException:
+        remove_tmp(tmp_path)
+        raise
+    try:
+        link_exclusive(tmp_path, path)
+    except FileExistsError:
+        #the encoded image stays in tmp_path (the filename of the error) so the caller can move it to a free name
+        raise FileExistsError(errno.EEXIST, "file exists: {}".format(path), tmp_path)
+    except BaseException:
+        remove_tmp(tmp_path)
+        raise
+    return path
+
+class ImageWriter:
+    def __init__(self, workers, processes=False):
+        self.workers = workers
+        self.processes = processes
+        self.executor = None
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.written = 0
+        self.failed = 0
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                if self.processes:
+                    self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+                else:
+                    self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image_writer")
+            return self.executor
+
+    def done(self, future, pending=True):
+        with self.lock:
+            if pending:
+                self.pending -= 1
+            if isinstance(future.exception(), FileExistsError):
+                pass #exclusive write lost the name to another saver, the caller picks a new one
+            elif future.exception() is not None:
+                self.failed += 1
+                logging.error("could not write image: {}".format(future.exception()))
+            else:
+                self.written += 1
+
+    def submit(self, pixels, path, text=None, compress_level=4, exclusive=False):
+        """Queues pixels (uint8 HWC array) to be written as a PNG to path, returns a future of the path."""
+        if self.workers <= 0:
+            future = concurrent.futures.Future()
+            try:
+                future.set_result(write_png(pixels, path, text, compress_level, exclusive))
+            except Exception as e:
+                future.set_exception(e)
+            self.done(future, pending=False)
+            return future
+
+        executor = self.get_executor()
+        with self.lock:
+            self.pending += 1
+        future = executor.submit(write_png, pixels, path, text, compress_level, exclusive)
+        future.add_done_callback(self.done)
+        return future
+
+    def stats(self):
+        with self.lock:
+            return {"workers": self.workers, "processes": self.processes, "queue_depth": self.pending, "written": self.written, "failed": self.failed}
+
+if args.image_writer_workers is None:
+    writer_workers = min(4, os.cpu_count() or 1)
+else:
+    writer_workers = args.image_writer_workers
+
+writer = ImageWriter(writer_workers, args.image_writer_processes)
+
+def submit(pixels, path, text=None, compress_level=4, exclusive=False):
+    return writer.submit(pixels, path, text, compress_level, exclusive)
+
+def wait(futures):
+    #waits for all the writes, then raises the error of the first one that failed
+    concurrent.futures.wait(futures)
+    for future in futures:
+        future.result()
+
+def stats():
+    return writer.stats()
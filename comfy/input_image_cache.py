@@ -0,0 +1,56 @@
+import os
+import hashlib
+import torch
+
+import comfy.utils
+from comfy.cli_args import args
+
+#Keeps the sha256 and the decoded tensors of input images keyed by (path, size, mtime) so that LoadImage and
+#LoadImageMask only stat an input file that didn't change instead of hashing and decoding it again.
+
+def file_key(path):
+    st = os.stat(path)
+    return (os.path.realpath(path), st.st_size, st.st_mtime_ns)
+
+def value_size(value):
+    if isinstance(value, torch.Tensor):
+        return value.nelement() * value.element_size()
+    if isinstance(value, (tuple, list)):
+        return sum(map(value_size, value))
+    return len(value)
+
+cache = comfy.utils.LRUCache(int(args.input_image_cache_ram * (1024 ** 3)), value_size)
+
+def sha256(path):
+    key = ("sha256",) + file_key(path)
+    out = cache.get(key)
+    if out is None:
+        m = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                m.update(chunk)
+        out = m.digest().hex()
+        cache.put(key, out)
+    return out
+
+def clone(value):
+    if isinstance(value, torch.Tensor):
+        return value.clone()
+    if isinstance(value, (tuple, list)):
+        return type(value)(map(clone, value))
+    return value
+
+def load(path, name, load_function):
+    #name identifies the loader and its options, load_function decodes the file
+    if cache.budget <= 0:
+        return load_function()
+    key = (name,) + file_key(path)
+    out = cache.get(key)
+    if out is None:
+        out = load_function()
+        cache.put(key, out)
+    #nodes downstream may modify their inputs in place, the cached tensors are never handed out
+    return clone(out)
+
+def stats():
+    return cache.stats()
@@ -1,4 +1,5 @@
 import math
+import collections
 
 from scipy import integrate
 import torch
@@ -7,6 +8,8 @@ import torchsde
 from tqdm.auto import trange, tqdm
 
 from . import utils
+import comfy.counter_rng
+from comfy.cli_args import args
 
 
 def append_zero(x):
@@ -98,6 +101,69 @@ class BatchedBrownianTree:
         return w if self.batched else w[0]
 
 
+class BatchedBrownianInterval:
+    """Brownian motion on [t0, t1] for a batch of seeds, all the batch items are evaluated with the same tensor ops.
+
+    W(t) is found by bisecting [t0, t1] down to tol: the value at each midpoint is a Brownian bridge sample drawn
+    with comfy.counter_rng keyed by the seed and the index of the node, so it doesn't depend on the order of the
+    queries. The nodes on the recently queried paths are cached, consecutive steps share most of their path.
+    """
+
+    def __init__(self, x, t0, t1, seed=None, tol=1e-6):
+        t0, t1, self.sign = BatchedBrownianTree.sort(float(t0), float(t1))
+        if seed is None:
+            seed = torch.randint(0, 2 ** 63 - 1, []).item()
+        self.batched = True
+        try:
+            assert len(seed) == x.shape[0]
+            self.shape = x.shape[1:]
+        except TypeError:
+            seed = [seed]
+            self.batched = False
+            self.shape = x.shape
+        self.seeds = comfy.counter_rng.seed_tensor(seed, device=x.device)
+        self.dtype = x.dtype
+        self.t0, self.t1 = t0, t1
+        self.depth = max(1, math.ceil(math.log2(max((t1 - t0) / tol, 1.0))))
+        self.cache = collections.OrderedDict()
+        self.cache_size = 2 * self.depth + 8
+        self.w1 = self.normal(0) * math.sqrt(t1 - t0)
+        self.w0 = torch.zeros_like(self.w1)
+
+    def normal(self, node):
+        return comfy.counter_rng.randn(math.prod(self.shape), self.seeds, node & 0xffffffff, comfy.counter_rng.STREAM_BROWNIAN | (node >> 32), dtype=torch.float32)
+
+    def w(self, t):
+        a, b = self.t0, self.t1
+        wa, wb = self.w0, self.w1
+        node = 1
+        for _ in range(self.depth):
+            if t <= a:
+                return wa
+            if t >= b:
+                return wb
+            m = (a + b) / 2
+            wm = self.cache.get(node)
+            if wm is None:
+                wm = (wa + wb) / 2 + self.normal(node) * math.sqrt((b - a) / 4)
+                self.cache[node] = wm
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+            else:
+                self.cache.move_to_end(node)
+            if t < m:
+                b, wb, node = m, wm, 2 * node
+            else:
+                a, wa, node = m, wm, 2 * node + 1
+        return wa + (wb - wa) * ((t - a) / (b - a))
+
+    def __call__(self, t0, t1):
+        t0, t1, sign = BatchedBrownianTree.sort(float(t0), float(t1))
+        w = (self.w(t1) - self.w(t0)) * (self.sign * sign)
+        w = w.reshape([-1] + list(self.shape)).to(self.dtype)
+        return w if self.batched else w[0]
+
+
 class BrownianTreeNoiseSampler:
     """A noise sampler backed by a torchsde.BrownianTree.
 
@@ -116,7 +182,10 @@ class BrownianTreeNoiseSampler:
     def __init__(self, x, sigma_min, sigma_max, seed=None, transform=lambda x: x, cpu=False):
         self.transform = transform
         t0, t1 = self.transform(torch.as_tensor(sigma_min)), self.transform(torch.as_tensor(sigma_max))
-        self.tree = BatchedBrownianTree(x, t0, t1, seed, cpu=cpu)
+        if args.counter_noise:
+            self.tree = BatchedBrownianInterval(x, t0, t1, seed)
+        else:
+            self.tree = BatchedBrownianTree(x, t0, t1, seed, cpu=cpu)
 
     def __call__(self, sigma, sigma_next):
         t0, t1 = self.transform(torch.as_tensor(sigma)), self.transform(torch.as_tensor(sigma_next))
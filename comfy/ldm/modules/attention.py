@@ -1,4 +1,5 @@
 import math
+import functools
 import torch
 import torch.nn.functional as F
 from torch import nn, einsum
@@ -17,6 +18,7 @@ if model_management.xformers_enabled():
 
 from comfy.cli_args import args
 import comfy.ops
+import comfy.attention_autotune
 ops = comfy.ops.disable_weight_init
 
 # CrossAttn precision handling
@@ -135,7 +137,7 @@ def attention_basic(q, k, v, heads, mask=None):
     return out
 
 
-def attention_sub_quad(query, key, value, heads, mask=None):
+def attention_sub_quad(query, key, value, heads, mask=None, query_chunk_size=None):
     b, _, dim_head = query.shape
     dim_head //= heads
 
@@ -159,14 +161,16 @@ def attention_sub_quad(query, key, value, heads, mask=None):
 
     kv_chunk_size_min = None
     kv_chunk_size = None
-    query_chunk_size = None
 
-    for x in [4096, 2048, 1024, 512, 256]:
-        count = mem_free_total / (batch_x_heads * bytes_per_token * x * 4.0)
-        if count >= k_tokens:
-            kv_chunk_size = k_tokens
-            query_chunk_size = x
-            break
+    if query_chunk_size is not None: #picked by the autotuner
+        kv_chunk_size = k_tokens
+    else:
+        for x in [4096, 2048, 1024, 512, 256]:
+            count = mem_free_total / (batch_x_heads * bytes_per_token * x * 4.0)
+            if count >= k_tokens:
+                kv_chunk_size = k_tokens
+                query_chunk_size = x
+                break
 
     if query_chunk_size is None:
         query_chunk_size = 512
@@ -365,6 +369,25 @@ else:
         logging.info("Using sub quadratic optimization for cross attention, if you have memory or speed issues try using: --use-split-cross-attention")
         optimized_attention = attention_sub_quad
 
+def autotune_backends():
+    backends = {"basic": attention_basic, "split": attention_split, "sub_quad": attention_sub_quad}
+    for chunk in [256, 1024, 4096]:
+        backends["sub_quad_q{}".format(chunk)] = functools.partial(attention_sub_quad, query_chunk_size=chunk)
+    if hasattr(torch.nn.functional, "scaled_dot_product_attention"):
+        backends["pytorch"] = attention_pytorch
+    if model_management.xformers_enabled():
+        backends["xformers"] = attention_xformers
+    return backends
+
+autotuner = comfy.attention_autotune.AttentionAutotuner(autotune_backends(), comfy.attention_autotune.cache_file)
+
+def attention_autotuned(q, k, v, heads, mask=None):
+    return autotuner.select(q, k, v, heads, mask)(q, k, v, heads, mask=mask)
+
+if comfy.attention_autotune.enabled:
+    logging.info("Using autotuned cross attention")
+    optimized_attention = attention_autotuned
+
 optimized_attention_masked = optimized_attention
 
 def optimized_attention_for_device(device, mask=False, small_input=False):
@@ -374,6 +397,9 @@ def optimized_attention_for_device(device, mask=False, small_input=False):
         else:
             return attention_basic
 
+    if comfy.attention_autotune.enabled:
+        return attention_autotuned
+
     if device == torch.device("cpu"):
         return attention_sub_quad
 
@@ -383,6 +409,47 @@ def optimized_attention_for_device(device, mask=False, small_input=False):
     return optimized_attention
 
 
+class CrossAttentionKVCache:
+    #K/V projections of the text context by CrossAttention layer for one sampling run. The sampler concatenates the
+    #conds again on every model call so contexts are matched by content, but only once per call: all the layers of a
+    #call get the same context tensor.
+    MAX_CONTEXTS = 8
+
+    def __init__(self):
+        self.contexts = []
+        self.kv = {}
+        self.last = (None, None)
+        self.hits = 0
+        self.misses = 0
+
+    def context_index(self, context):
+        if self.last[0] is context:
+            return self.last[1]
+        index = None
+        for i, c in enumerate(self.contexts):
+            if c is context or (c.shape == context.shape and c.dtype == context.dtype and c.device == context.device and torch.equal(c, context)):
+                index = i
+                break
+        if index is None and len(self.contexts) < self.MAX_CONTEXTS:
+            self.contexts.append(context)
+            index = len(self.contexts) - 1
+        self.last = (context, index)
+        return index
+
+    def get(self, layer, context):
+        index = self.context_index(context)
+        if index is None:
+            return layer.to_k(context), layer.to_v(context)
+        out = self.kv.get((index, layer), None)
+        if out is None:
+            self.misses += 1
+            out = (layer.to_k(context), layer.to_v(context))
+            self.kv[(index, layer)] = out
+        else:
+            self.hits += 1
+        return out
+
+
 class CrossAttention(nn.Module):
     def __init__(self, query_dim, context_dim=None, heads=8, dim_head=64, dropout=0., dtype=None, device=None, operations=ops):
         super().__init__()
@@ -398,15 +465,18 @@ class CrossAttention(nn.Module):
 
         self.to_out = nn.Sequential(operations.Linear(inner_dim, query_dim, dtype=dtype, device=device), nn.Dropout(dropout))
 
-    def forward(self, x, context=None, value=None, mask=None):
+    def forward(self, x, context=None, value=None, mask=None, kv_cache=None):
         q = self.to_q(x)
-        context = default(context, x)
-        k = self.to_k(context)
-        if value is not None:
-            v = self.to_v(value)
-            del value
+        if kv_cache is not None and context is not None and value is None:
+            k, v = kv_cache.get(self, context)
         else:
-            v = self.to_v(context)
+            context = default(context, x)
+            k = self.to_k(context)
+            if value is not None:
+                v = self.to_v(value)
+                del value
+            else:
+                v = self.to_v(context)
 
         if mask is None:
             out = optimized_attention(q, k, v, self.heads)
@@ -557,7 +627,10 @@ class BasicTransformerBlock(nn.Module):
                 n = attn2_replace_patch[block_attn2](n, context_attn2, value_attn2, extra_options)
                 n = self.attn2.to_out(n)
             else:
-                n = self.attn2(n, context=context_attn2, value=value_attn2)
+                kv_cache = None
+                if not self.switch_temporal_ca_to_sa and value_attn2 is None:
+                    kv_cache = transformer_options.get("cross_attn_kv_cache", None)
+                n = self.attn2(n, context=context_attn2, value=value_attn2, kv_cache=kv_cache)
 
         if "attn2_output_patch" in transformer_patches:
             patch = transformer_patches["attn2_output_patch"]
@@ -0,0 +1,78 @@
+import math
+import torch
+
+import comfy.model_management
+from comfy.cli_args import args
+
+#Computes the deltas of lora and loha patches for many keys at once: patches whose factors have the same shapes are
+#stacked, moved to the device in one transfer and multiplied with a single bmm instead of one mm per key.
+#ModelPatcher.calculate_weight adds the precomputed deltas, every other patch type goes through the regular path.
+
+batched_merge_enabled = not args.disable_batched_lora_merge
+
+MAX_BATCH_BYTES = 512 * 1024 * 1024
+
+def group_key(v):
+    if isinstance(v, list) or len(v) != 2:
+        return None
+    patch_type, v = v
+    if patch_type == "lora" and v[3] is None:
+        return ("lora", v[0].shape, v[1].shape, v[0].dtype, v[1].dtype)
+    elif patch_type == "loha" and v[5] is None and all(len(v[i].shape) == 2 and v[i].dtype == v[0].dtype for i in (1, 3, 4)):
+        return ("loha", v[0].shape, v[1].shape, v[3].shape, v[4].shape, v[0].dtype)
+    return None
+
+def delta_bytes(v):
+    patch_type, v = v
+    if patch_type == "lora":
+        return v[0].shape[0] * math.prod(v[1].shape[1:]) * 4
+    return v[0].shape[0] * v[1].shape[1] * 4
+
+def stack_to_device(tensors, device):
+    return comfy.model_management.cast_to_device(torch.stack(tensors), device, torch.float32)
+
+def lora_deltas(items, device):
+    up = stack_to_device([v[0].flatten(start_dim=1) for alpha, v in items], device)
+    down = stack_to_device([v[1].flatten(start_dim=1) for alpha, v in items], device)
+    alphas = [alpha * v[2] / v[1].shape[0] if v[2] is not None else alpha for alpha, v in items]
+    return torch.bmm(up, down).mul_(torch.tensor(alphas, device=device, dtype=torch.float32).view(-1, 1, 1))
+
+def loha_deltas(items, device):
+    m1 = torch.bmm(stack_to_device([v[0] for alpha, v in items], device), stack_to_device([v[1] for alpha, v in items], device))
+    m2 = torch.bmm(stack_to_device([v[3] for alpha, v in items], device), stack_to_device([v[4] for alpha, v in items], device))
+    alphas = [alpha * v[2] / v[1].shape[0] if v[2] is not None else alpha for alpha, v in items]
+    return m1.mul_(m2).mul_(torch.tensor(alphas, device=device, dtype=torch.float32).view(-1, 1, 1))
+
+def chunk_keys(keys, patches, device):
+    #splits the keys so that the deltas computed for each chunk stay under the memory budget
+    budget = min(MAX_BATCH_BYTES, comfy.model_management.get_free_memory(device) // 4)
+    chunk = []
+    size = 0
+    for k in keys:
+        s = sum(delta_bytes(p[1]) for p in patches[k] if group_key(p[1]) is not None)
+        if len(chunk) > 0 and size + s > budget:
+            yield chunk
+            chunk = []
+            size = 0
+        chunk.append(k)
+        size += s
+    if len(chunk) > 0:
+        yield chunk
+
+def compute_deltas(patches, keys, device):
+    groups = {}
+    for k in keys:
+        for i, p in enumerate(patches[k]):
+            g = group_key(p[1])
+            if g is not None:
+                groups.setdefault(g, []).append(((k, i), (p[0], p[1][1])))
+
+    out = {}
+    for g, items in groups.items():
+        if g[0] == "lora":
+            deltas = lora_deltas([x[1] for x in items], device)
+        else:
+            deltas = loha_deltas([x[1] for x in items], device)
+        for i, x in enumerate(items):
+            out[x[0]] = deltas[i]
+    return out
@@ -0,0 +1,56 @@
+import os
+import logging
+
+import comfy.model_patcher
+import comfy.utils
+from comfy.cli_args import args
+
+DTYPE_ARGS = ("force_fp32", "force_fp16", "bf16_unet", "fp16_unet", "fp8_e4m3fn_unet", "fp8_e5m2_unet", "fp16_vae", "fp32_vae", "bf16_vae", "cpu_vae",
+              "fp8_e4m3fn_text_enc", "fp8_e5m2_text_enc", "fp16_text_enc", "fp32_text_enc")
+
+def dtype_key():
+    return tuple(getattr(args, a) for a in DTYPE_ARGS)
+
+def file_key(path):
+    st = os.stat(path)
+    return (os.path.realpath(path), st.st_size, st.st_mtime_ns)
+
+def object_size(obj):
+    if obj is None:
+        return 0
+    if isinstance(obj, comfy.model_patcher.ModelPatcher):
+        return obj.model_size()
+    if isinstance(obj, (tuple, list)):
+        return sum(map(object_size, obj))
+    patcher = getattr(obj, "patcher", None)
+    if patcher is not None:
+        return patcher.model_size()
+    return 0
+
+def clone_object(obj):
+    if obj is None:
+        return None
+    if isinstance(obj, (tuple, list)):
+        return type(obj)(map(clone_object, obj))
+    if hasattr(obj, "clone"):
+        return obj.clone()
+    return obj #VAE and CLIP vision objects are never patched so they can be shared
+
+model_cache_budget = int(args.model_cache_ram * (1024 ** 3))
+
+cache = comfy.utils.LRUCache(model_cache_budget, object_size)
+
+def load_cached(loader, paths, load_function, **options):
+    if cache.budget <= 0:
+        return load_function()
+
+    key = (loader, tuple(map(file_key, paths)), dtype_key(), tuple(sorted(options.items())))
+    out = cache.get(key)
+    if out is None:
+        out = load_function()
+        cache.put(key, out)
+        logging.debug("model cache {}".format(cache.stats()))
+    return clone_object(out)
+
+def stats():
+    return cache.stats()
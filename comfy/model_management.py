@@ -322,7 +322,7 @@ class LoadedModel:
 
         return self.real_model
 
-    def model_unload(self):
+    def model_unload(self, keep_device=False):
         if self.model_accelerated:
             for m in self.real_model.modules():
                 if hasattr(m, "prev_comfy_cast_weights"):
@@ -331,7 +331,7 @@ class LoadedModel:
 
             self.model_accelerated = False
 
-        self.model.unpatch_model(self.model.offload_device)
+        self.model.unpatch_model(None if keep_device else self.model.offload_device)
         self.model.model_patches_to(self.model.offload_device)
 
     def __eq__(self, other):
@@ -340,7 +340,8 @@ class LoadedModel:
 def minimum_inference_memory():
     return (1024 * 1024 * 1024)
 
-def unload_model_clones(model):
+def unload_model_clones(model, keep_device=False):
+    #keep_device leaves the weights where they are so the clone that replaces it doesn't need to move the whole model again
     to_unload = []
     for i in range(len(current_loaded_models)):
         if model.is_clone(current_loaded_models[i].model):
@@ -348,7 +349,10 @@ def unload_model_clones(model):
 
     for i in to_unload:
         logging.debug("unload clone {}".format(i))
-        current_loaded_models.pop(i).model_unload()
+        m = current_loaded_models.pop(i)
+        m.model_unload(keep_device)
+        if keep_device:
+            model.current_device = m.model.current_device
 
 def free_memory(memory_required, device, keep_loaded=[]):
     unloaded_model = False
@@ -403,7 +407,7 @@ def load_models_gpu(models, memory_required=0):
 
     total_memory_required = {}
     for loaded_model in models_to_load:
-        unload_model_clones(loaded_model.model)
+        unload_model_clones(loaded_model.model, keep_device=getattr(loaded_model.model, "lora_mode", "merge") == "unmerged")
         total_memory_required[loaded_model.device] = total_memory_required.get(loaded_model.device, 0) + loaded_model.model_memory_required(loaded_model.device)
 
     for device in total_memory_required:
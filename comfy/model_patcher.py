@@ -2,9 +2,16 @@ import torch
 import copy
 import inspect
 import logging
+import uuid
 
 import comfy.utils
 import comfy.model_management
+import comfy.weight_cache
+import comfy.lora_merge
+import comfy.ops
+from comfy.cli_args import args
+
+MAX_ADAPTER_FLOPS_RATIO = 0.25
 
 class ModelPatcher:
     def __init__(self, model, load_device, offload_device, size=0, current_device=None, weight_inplace_update=False):
@@ -24,6 +31,8 @@ class ModelPatcher:
             self.current_device = current_device
 
         self.weight_inplace_update = weight_inplace_update
+        self.lora_mode = "unmerged" if args.unmerged_lora else "merge"
+        self.adapter_backup = {}
 
     def model_size(self):
         if self.size > 0:
@@ -42,6 +51,7 @@ class ModelPatcher:
         n.object_patches = self.object_patches.copy()
         n.model_options = copy.deepcopy(self.model_options)
         n.model_keys = self.model_keys
+        n.lora_mode = self.lora_mode
         return n
 
     def is_clone(self, other):
@@ -71,6 +81,10 @@ class ModelPatcher:
     def set_model_denoise_mask_function(self, denoise_mask_function):
         self.model_options["denoise_mask_function"] = denoise_mask_function
 
+    def set_model_cross_attn_kv_cache(self, enabled=True):
+        #reuse the to_k/to_v projections of the text context across the steps of a sampling run
+        self.model_options["cross_attn_kv_cache"] = enabled
+
     def set_model_patch(self, patch, name):
         to = self.model_options["transformer_options"]
         if "patches" not in to:
@@ -119,6 +133,14 @@ class ModelPatcher:
     def add_object_patch(self, name, obj):
         self.object_patches[name] = obj
 
+    def set_lora_mode(self, mode):
+        #"merge": lora weights are merged into the model weights when the model is loaded
+        #"unmerged": lora patches are attached as low rank adapters to the comfy.ops Linear/Conv2d layers and
+        #applied in their forward, keys where that would cost too many extra flops are still merged
+        if mode not in ("merge", "unmerged"):
+            raise ValueError("unknown lora mode {}".format(mode))
+        self.lora_mode = mode
+
     def model_patches_to(self, device):
         to = self.model_options["transformer_options"]
         if "patches" in to:
@@ -144,17 +166,29 @@ class ModelPatcher:
         if hasattr(self.model, "get_dtype"):
             return self.model.get_dtype()
 
-    def add_patches(self, patches, strength_patch=1.0, strength_model=1.0):
+    def add_patches(self, patches, strength_patch=1.0, strength_model=1.0, patches_id=None):
+        #patches_id identifies the source of the patches (for example a lora file) so merged weights can be cached
         p = set()
         for k in patches:
             if k in self.model_keys:
                 p.add(k)
                 current_patches = self.patches.get(k, [])
-                current_patches.append((strength_patch, patches[k], strength_model))
+                current_patches.append((strength_patch, patches[k], strength_model, patches_id))
                 self.patches[k] = current_patches
 
         return list(p)
 
+    def weight_cache_key(self, key):
+        if not comfy.weight_cache.enabled():
+            return None
+        patches = self.patches[key]
+        for p in patches:
+            if len(p) < 4 or p[3] is None:
+                return None
+        if not hasattr(self.model, "weight_cache_uuid"):
+            self.model.weight_cache_uuid = uuid.uuid4().hex
+        return (self.model.weight_cache_uuid, key, tuple((p[3], p[0], p[2]) for p in patches))
+
     def get_key_patches(self, filter_prefix=None):
         comfy.model_management.unload_model_clones(self)
         model_sd = self.model_state_dict()
@@ -186,28 +220,41 @@ class ModelPatcher:
 
         if patch_weights:
             model_sd = self.model_state_dict()
+            keys = []
             for key in self.patches:
                 if key not in model_sd:
                     logging.warning("could not patch. key doesn't exist in model: {}".format(key))
                     continue
+                keys.append(key)
 
-                weight = model_sd[key]
+            if self.lora_mode == "unmerged":
+                keys = [k for k in keys if not self.attach_lora_adapters(model_sd, k, device_to)]
 
-                inplace_update = self.weight_inplace_update
+            cached = {}
+            for key in keys:
+                cache_key = self.weight_cache_key(key)
+                if cache_key is not None:
+                    cached[key] = (cache_key, comfy.weight_cache.get(cache_key))
 
-                if key not in self.backup:
-                    self.backup[key] = weight.to(device=self.offload_device, copy=inplace_update)
+            to_merge = [k for k in keys if cached.get(k, (None, None))[1] is None]
+            if comfy.lora_merge.batched_merge_enabled and len(to_merge) > 0:
+                merge_device = device_to if device_to is not None else model_sd[to_merge[0]].device
+                chunks = comfy.lora_merge.chunk_keys(to_merge, self.patches, merge_device)
+            else:
+                merge_device = None
+                chunks = [to_merge]
 
-                if device_to is not None:
-                    temp_weight = comfy.model_management.cast_to_device(weight, device_to, torch.float32, copy=True)
-                else:
-                    temp_weight = weight.to(torch.float32, copy=True)
-                out_weight = self.calculate_weight(self.patches[key], temp_weight, key).to(weight.dtype)
-                if inplace_update:
-                    comfy.utils.copy_to_param(self.model, key, out_weight)
-                else:
-                    comfy.utils.set_attr_param(self.model, key, out_weight)
-                del temp_weight
+            for key in keys:
+                if key in cached and cached[key][1] is not None:
+                    self.patch_weight(model_sd, key, device_to, cached_weight=cached[key][1])
+
+            for chunk in chunks:
+                deltas = None
+                if merge_device is not None:
+                    deltas = comfy.lora_merge.compute_deltas(self.patches, chunk, merge_device)
+                for key in chunk:
+                    self.patch_weight(model_sd, key, device_to, deltas=deltas, cache_key=cached.get(key, (None, None))[0])
+                del deltas
 
             if device_to is not None:
                 self.model.to(device_to)
@@ -215,8 +262,87 @@ class ModelPatcher:
 
         return self.model
 
-    def calculate_weight(self, patches, weight, key):
-        for p in patches:
+    def lora_adapters(self, key, module, weight):
+        if not key.endswith(".weight"):
+            return None
+        if isinstance(module, comfy.ops.disable_weight_init.Linear):
+            conv = False
+        elif isinstance(module, comfy.ops.disable_weight_init.Conv2d) and module.groups == 1 and module.padding_mode == "zeros":
+            conv = True
+        else:
+            return None
+
+        adapters = []
+        flops = 0
+        for p in self.patches[key]:
+            strength_patch, v, strength_model = p[0], p[1], p[2]
+            if strength_model != 1.0 or isinstance(v, list) or len(v) != 2 or v[0] != "lora" or v[1][3] is not None:
+                return None
+            up, down, alpha, _ = v[1]
+            rank = down.shape[0]
+            if conv:
+                if len(down.shape) == 2:
+                    down = down.reshape(down.shape + (1, 1))
+                up = up.reshape(up.shape[0], -1, 1, 1)
+                if down.shape[1:] != weight.shape[1:] or up.shape[:2] != (weight.shape[0], rank):
+                    return None
+            else:
+                down = down.flatten(start_dim=1)
+                up = up.flatten(start_dim=1)
+                if down.shape[1] != weight.shape[1] or up.shape != (weight.shape[0], rank):
+                    return None
+            if alpha is not None:
+                strength_patch *= alpha / rank
+            flops += rank * (weight[0].nelement() + weight.shape[0])
+            adapters.append((down, up, strength_patch))
+
+        if flops > weight.nelement() * MAX_ADAPTER_FLOPS_RATIO: #merging is cheaper than running this many adapters
+            return None
+        return adapters
+
+    def attach_lora_adapters(self, model_sd, key, device_to=None):
+        weight = model_sd[key]
+        module_key = key[:-len(".weight")]
+        module = comfy.utils.get_attr(self.model, module_key)
+        adapters = self.lora_adapters(key, module, weight)
+        if adapters is None:
+            return False
+
+        device = weight.device if device_to is None else device_to
+        dtype = weight.dtype if weight.dtype in (torch.float32, torch.float16, torch.bfloat16) else torch.float32
+        module.lora_adapters = [(down.to(device=device, dtype=dtype), up.to(device=device, dtype=dtype), scale) for down, up, scale in adapters]
+        if module_key not in self.adapter_backup:
+            self.adapter_backup[module_key] = module.comfy_cast_weights
+        module.comfy_cast_weights = True
+        return True
+
+    def patch_weight(self, model_sd, key, device_to=None, deltas=None, cache_key=None, cached_weight=None):
+        weight = model_sd[key]
+
+        inplace_update = self.weight_inplace_update
+
+        if key not in self.backup:
+            self.backup[key] = weight.to(device=self.offload_device, copy=inplace_update)
+
+        if cached_weight is not None:
+            out_weight = cached_weight.to(device=weight.device if device_to is None else device_to, dtype=weight.dtype, copy=True)
+        else:
+            if device_to is not None:
+                temp_weight = comfy.model_management.cast_to_device(weight, device_to, torch.float32, copy=True)
+            else:
+                temp_weight = weight.to(torch.float32, copy=True)
+            out_weight = self.calculate_weight(self.patches[key], temp_weight, key, deltas).to(weight.dtype)
+            del temp_weight
+            if cache_key is not None:
+                comfy.weight_cache.put(cache_key, out_weight)
+
+        if inplace_update:
+            comfy.utils.copy_to_param(self.model, key, out_weight)
+        else:
+            comfy.utils.set_attr_param(self.model, key, out_weight)
+
+    def calculate_weight(self, patches, weight, key, deltas=None):
+        for i, p in enumerate(patches):
             alpha = p[0]
             v = p[1]
             strength_model = p[2]
@@ -224,6 +350,13 @@ class ModelPatcher:
             if strength_model != 1.0:
                 weight *= strength_model
 
+            if deltas is not None and (key, i) in deltas: #precomputed by comfy.lora_merge
+                try:
+                    weight += deltas[(key, i)].reshape(weight.shape).to(weight.device)
+                except Exception as e:
+                    logging.error("ERROR {} {} {}".format(v[0], key, e))
+                continue
+
             if isinstance(v, list):
                 v = (self.calculate_weight(v[1:], v[0].clone(), key), )
 
@@ -352,6 +485,12 @@ class ModelPatcher:
 
         self.backup = {}
 
+        for k in self.adapter_backup:
+            m = comfy.utils.get_attr(self.model, k)
+            m.comfy_cast_weights = self.adapter_backup[k]
+            m.lora_adapters = None
+        self.adapter_backup = {}
+
         if device_to is not None:
             self.model.to(device_to)
             self.current_device = device_to
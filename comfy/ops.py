@@ -27,16 +27,26 @@ def cast_bias_weight(s, input):
     weight = s.weight.to(device=input.device, dtype=input.dtype, non_blocking=non_blocking)
     return weight, bias
 
+def cast_lora_adapters(s, input):
+    non_blocking = comfy.model_management.device_supports_non_blocking(input.device)
+    for down, up, scale in s.lora_adapters:
+        yield down.to(device=input.device, dtype=input.dtype, non_blocking=non_blocking), up.to(device=input.device, dtype=input.dtype, non_blocking=non_blocking), scale
+
 
 class disable_weight_init:
     class Linear(torch.nn.Linear):
         comfy_cast_weights = False
+        lora_adapters = None
         def reset_parameters(self):
             return None
 
         def forward_comfy_cast_weights(self, input):
             weight, bias = cast_bias_weight(self, input)
-            return torch.nn.functional.linear(input, weight, bias)
+            out = torch.nn.functional.linear(input, weight, bias)
+            if self.lora_adapters is not None:
+                for down, up, scale in cast_lora_adapters(self, input):
+                    out = out + torch.nn.functional.linear(torch.nn.functional.linear(input, down), up) * scale
+            return out
 
         def forward(self, *args, **kwargs):
             if self.comfy_cast_weights:
@@ -46,12 +56,17 @@ class disable_weight_init:
 
     class Conv2d(torch.nn.Conv2d):
         comfy_cast_weights = False
+        lora_adapters = None
         def reset_parameters(self):
             return None
 
         def forward_comfy_cast_weights(self, input):
             weight, bias = cast_bias_weight(self, input)
-            return self._conv_forward(input, weight, bias)
+            out = self._conv_forward(input, weight, bias)
+            if self.lora_adapters is not None:
+                for down, up, scale in cast_lora_adapters(self, input):
+                    out = out + torch.nn.functional.conv2d(torch.nn.functional.conv2d(input, down, None, self.stride, self.padding, self.dilation), up) * scale
+            return out
 
         def forward(self, *args, **kwargs):
             if self.comfy_cast_weights:
@@ -3,14 +3,18 @@ import comfy.model_management
 import comfy.samplers
 import comfy.conds
 import comfy.utils
+import comfy.counter_rng
 import math
 import numpy as np
+from comfy.cli_args import args
 
-def prepare_noise(latent_image, seed, noise_inds=None):
-    """
-    creates random noise given a latent image and a seed.
-    optional arg skip can be used to skip and discard x number of noise generations for a given seed
-    """
+def counter_noise(shape, seed, batch_inds):
+    #noise of shape [len(batch_inds)] + shape where each batch item only depends on (seed, batch index)
+    batch = torch.tensor(list(batch_inds), dtype=torch.int64).unsqueeze(1)
+    noise = comfy.counter_rng.randn(math.prod(shape), comfy.counter_rng.seed_tensor([seed]), batch)
+    return noise.reshape([batch.shape[0]] + list(shape)).float()
+
+def prepare_noise_legacy(latent_image, seed, noise_inds=None):
     generator = torch.manual_seed(seed)
     if noise_inds is None:
         return torch.randn(latent_image.size(), dtype=latent_image.dtype, layout=latent_image.layout, generator=generator, device="cpu")
@@ -25,6 +29,18 @@ def prepare_noise(latent_image, seed, noise_inds=None):
     noises = torch.cat(noises, axis=0)
     return noises
 
+def prepare_noise(latent_image, seed, noise_inds=None):
+    """
+    creates random noise given a latent image and a seed.
+    noise_inds are the batch indexes of the latents
+    --counter-noise uses a counter based generator where the noise of each latent only depends on the seed and its index
+    """
+    if not args.counter_noise:
+        return prepare_noise_legacy(latent_image, seed, noise_inds)
+    if noise_inds is None:
+        noise_inds = range(latent_image.shape[0])
+    return counter_noise(latent_image.shape[1:], seed, noise_inds).to(latent_image.dtype)
+
 def prepare_mask(noise_mask, shape, device):
     """ensures noise mask is of proper dimensions"""
     noise_mask = torch.nn.functional.interpolate(noise_mask.reshape((-1, 1, noise_mask.shape[-2], noise_mask.shape[-1])), size=(shape[2], shape[3]), mode="bilinear")
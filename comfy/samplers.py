@@ -5,6 +5,8 @@ import collections
 from comfy import model_management
 import math
 import logging
+import comfy.ldm.modules.attention
+import comfy.utils
 
 def get_area_and_mult(conds, x_in, timestep_in):
     area = (x_in.shape[2], x_in.shape[3], 0, 0)
@@ -35,24 +37,12 @@ def get_area_and_mult(conds, x_in, timestep_in):
         assert(mask.shape[2] == x_in.shape[3])
         mask = mask[:,area[2]:area[0] + area[2],area[3]:area[1] + area[3]] * mask_strength
         mask = mask.unsqueeze(1).repeat(input_x.shape[0] // mask.shape[0], input_x.shape[1], 1, 1)
+        mult = mask * strength
     else:
-        mask = torch.ones_like(input_x)
-    mult = mask * strength
-
-    if 'mask' not in conds:
+        #feather the edges of the area that are not on the border of the image
         rr = 8
-        if area[2] != 0:
-            for t in range(rr):
-                mult[:,:,t:1+t,:] *= ((1.0/rr) * (t + 1))
-        if (area[0] + area[2]) < x_in.shape[2]:
-            for t in range(rr):
-                mult[:,:,area[0] - 1 - t:area[0] - t,:] *= ((1.0/rr) * (t + 1))
-        if area[3] != 0:
-            for t in range(rr):
-                mult[:,:,:,t:1+t] *= ((1.0/rr) * (t + 1))
-        if (area[1] + area[3]) < x_in.shape[3]:
-            for t in range(rr):
-                mult[:,:,:,area[1] - 1 - t:area[1] - t] *= ((1.0/rr) * (t + 1))
+        edges = (area[2] != 0, (area[0] + area[2]) < x_in.shape[2], area[3] != 0, (area[1] + area[3]) < x_in.shape[3])
+        mult = comfy.utils.feather_mask(input_x.shape[2], input_x.shape[3], rr, edges, input_x.device, input_x.dtype).expand(input_x.shape) * strength
 
     conditioning = {}
     model_conds = conds["model_conds"]
@@ -604,6 +594,11 @@ def sample(model, noise, positive, negative, cfg, device, sampler, sigmas, model
     apply_empty_x_to_equal_area(list(filter(lambda c: c.get('control_apply_to_uncond', False) == True, positive)), negative, 'control', lambda cond_cnets, x: cond_cnets[x])
     apply_empty_x_to_equal_area(positive, negative, 'gligen', lambda cond_cnets, x: cond_cnets[x])
 
+    if model_options.get("cross_attn_kv_cache", False):
+        #the cache only lives for this run, the text context can't change between its steps
+        model_options = model_options.copy()
+        model_options["transformer_options"] = {**model_options.get("transformer_options", {}), "cross_attn_kv_cache": comfy.ldm.modules.attention.CrossAttentionKVCache()}
+
     extra_args = {"cond":positive, "uncond":negative, "cond_scale": cfg, "model_options": model_options, "seed":seed}
 
     samples = sampler.sample(model_wrap, sigmas, extra_args, callback, noise, latent_image, denoise_mask, disable_pbar)
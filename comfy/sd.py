@@ -35,8 +35,7 @@ def load_model_weights(model, sd):
     k = list(sd.keys())
     for x in k:
         if x not in unexpected_keys:
-            w = sd.pop(x)
-            del w
+            del sd[x]
     if len(m) > 0:
         logging.warning("missing {}".format(m))
     return model
@@ -46,7 +45,7 @@ def load_clip_weights(model, sd):
     for x in k:
         if x.startswith("cond_stage_model.transformer.") and not x.startswith("cond_stage_model.transformer.text_model."):
             y = x.replace("cond_stage_model.transformer.", "cond_stage_model.transformer.text_model.")
-            sd[y] = sd.pop(x)
+            comfy.utils.move_state_dict_key(sd, x, y)
 
     if 'cond_stage_model.transformer.text_model.embeddings.position_ids' in sd:
         ids = sd['cond_stage_model.transformer.text_model.embeddings.position_ids']
@@ -57,7 +56,7 @@ def load_clip_weights(model, sd):
     return load_model_weights(model, sd)
 
 
-def load_lora_for_models(model, clip, lora, strength_model, strength_clip):
+def load_lora_for_models(model, clip, lora, strength_model, strength_clip, lora_id=None):
     key_map = {}
     if model is not None:
         key_map = comfy.lora.model_lora_keys_unet(model.model, key_map)
@@ -67,14 +66,14 @@ def load_lora_for_models(model, clip, lora, strength_model, strength_clip):
     loaded = comfy.lora.load_lora(lora, key_map)
     if model is not None:
         new_modelpatcher = model.clone()
-        k = new_modelpatcher.add_patches(loaded, strength_model)
+        k = new_modelpatcher.add_patches(loaded, strength_model, patches_id=lora_id)
     else:
         k = ()
         new_modelpatcher = None
 
     if clip is not None:
         new_clip = clip.clone()
-        k1 = new_clip.add_patches(loaded, strength_clip)
+        k1 = new_clip.add_patches(loaded, strength_clip, patches_id=lora_id)
     else:
         k1 = ()
         new_clip = None
@@ -114,8 +113,8 @@ class CLIP:
         n.layer_idx = self.layer_idx
         return n
 
-    def add_patches(self, patches, strength_patch=1.0, strength_model=1.0):
-        return self.patcher.add_patches(patches, strength_patch, strength_model)
+    def add_patches(self, patches, strength_patch=1.0, strength_model=1.0, patches_id=None):
+        return self.patcher.add_patches(patches, strength_patch, strength_model, patches_id)
 
     def clip_layer(self, layer_idx):
         self.layer_idx = layer_idx
@@ -252,55 +251,95 @@ class VAE:
             pixels = pixels[:, x_offset:x + x_offset, y_offset:y + y_offset, :]
         return pixels
 
-    def decode_tiled_(self, samples, tile_x=64, tile_y=64, overlap = 16):
+    def run_tiled(self, run, tile_batch):
+        #run(tile_batch) does the tiled passes, tile_batch is halved down to 1 when they run out of memory
+        while True:
+            try:
+                return run(tile_batch)
+            except model_management.OOM_EXCEPTION as e:
+                if tile_batch <= 1:
+                    raise e
+                tile_batch //= 2
+                logging.warning("Warning: Ran out of memory when running the VAE on batches of tiles, retrying with {} tiles at a time.".format(tile_batch))
+
+    def decode_tiled_(self, samples, tile_x=64, tile_y=64, overlap = 16, mode="three_pass"):
+        #single_pass: one pass of tiles blended over their overlap
+        #three_pass: the average of three passes with tiles of different aspect ratios, 3x slower
         steps = samples.shape[0] * comfy.utils.get_tiled_scale_steps(samples.shape[3], samples.shape[2], tile_x, tile_y, overlap)
-        steps += samples.shape[0] * comfy.utils.get_tiled_scale_steps(samples.shape[3], samples.shape[2], tile_x // 2, tile_y * 2, overlap)
-        steps += samples.shape[0] * comfy.utils.get_tiled_scale_steps(samples.shape[3], samples.shape[2], tile_x * 2, tile_y // 2, overlap)
-        pbar = comfy.utils.ProgressBar(steps)
+        if mode == "three_pass":
+            steps += samples.shape[0] * comfy.utils.get_tiled_scale_steps(samples.shape[3], samples.shape[2], tile_x // 2, tile_y * 2, overlap)
+            steps += samples.shape[0] * comfy.utils.get_tiled_scale_steps(samples.shape[3], samples.shape[2], tile_x * 2, tile_y // 2, overlap)
 
+        tile_batch = comfy.utils.tile_batch_size(model_management.get_free_memory(self.device), self.memory_used_decode((1, samples.shape[1], tile_y, tile_x), self.vae_dtype))
         decode_fn = lambda a: self.first_stage_model.decode(a.to(self.vae_dtype).to(self.device)).float()
-        output = self.process_output(
-            (comfy.utils.tiled_scale(samples, decode_fn, tile_x // 2, tile_y * 2, overlap, upscale_amount = self.upscale_ratio, output_device=self.output_device, pbar = pbar) +
-            comfy.utils.tiled_scale(samples, decode_fn, tile_x * 2, tile_y // 2, overlap, upscale_amount = self.upscale_ratio, output_device=self.output_device, pbar = pbar) +
-             comfy.utils.tiled_scale(samples, decode_fn, tile_x, tile_y, overlap, upscale_amount = self.upscale_ratio, output_device=self.output_device, pbar = pbar))
-            / 3.0)
-        return output
-
-    def encode_tiled_(self, pixel_samples, tile_x=512, tile_y=512, overlap = 64):
+
+        def run(tile_batch):
+            pbar = comfy.utils.ProgressBar(steps)
+            if mode == "single_pass":
+                return self.process_output(comfy.utils.tiled_scale(samples, decode_fn, tile_x, tile_y, overlap, upscale_amount = self.upscale_ratio, output_device=self.output_device, pbar = pbar, tile_batch=tile_batch))
+
+            return self.process_output(
+                (comfy.utils.tiled_scale(samples, decode_fn, tile_x // 2, tile_y * 2, overlap, upscale_amount = self.upscale_ratio, output_device=self.output_device, pbar = pbar, tile_batch=tile_batch) +
+                comfy.utils.tiled_scale(samples, decode_fn, tile_x * 2, tile_y // 2, overlap, upscale_amount = self.upscale_ratio, output_device=self.output_device, pbar = pbar, tile_batch=tile_batch) +
+                 comfy.utils.tiled_scale(samples, decode_fn, tile_x, tile_y, overlap, upscale_amount = self.upscale_ratio, output_device=self.output_device, pbar = pbar, tile_batch=tile_batch))
+                / 3.0)
+        return self.run_tiled(run, tile_batch)
+
+    def encode_tiled_(self, pixel_samples, tile_x=512, tile_y=512, overlap = 64, mode="three_pass"):
         steps = pixel_samples.shape[0] * comfy.utils.get_tiled_scale_steps(pixel_samples.shape[3], pixel_samples.shape[2], tile_x, tile_y, overlap)
-        steps += pixel_samples.shape[0] * comfy.utils.get_tiled_scale_steps(pixel_samples.shape[3], pixel_samples.shape[2], tile_x // 2, tile_y * 2, overlap)
-        steps += pixel_samples.shape[0] * comfy.utils.get_tiled_scale_steps(pixel_samples.shape[3], pixel_samples.shape[2], tile_x * 2, tile_y // 2, overlap)
-        pbar = comfy.utils.ProgressBar(steps)
+        if mode == "three_pass":
+            steps += pixel_samples.shape[0] * comfy.utils.get_tiled_scale_steps(pixel_samples.shape[3], pixel_samples.shape[2], tile_x // 2, tile_y * 2, overlap)
+            steps += pixel_samples.shape[0] * comfy.utils.get_tiled_scale_steps(pixel_samples.shape[3], pixel_samples.shape[2], tile_x * 2, tile_y // 2, overlap)
 
+        tile_batch = comfy.utils.tile_batch_size(model_management.get_free_memory(self.device), self.memory_used_encode((1, pixel_samples.shape[1], tile_y, tile_x), self.vae_dtype))
         encode_fn = lambda a: self.first_stage_model.encode((self.process_input(a)).to(self.vae_dtype).to(self.device)).float()
-        samples = comfy.utils.tiled_scale(pixel_samples, encode_fn, tile_x, tile_y, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar)
-        samples += comfy.utils.tiled_scale(pixel_samples, encode_fn, tile_x * 2, tile_y // 2, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar)
-        samples += comfy.utils.tiled_scale(pixel_samples, encode_fn, tile_x // 2, tile_y * 2, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar)
-        samples /= 3.0
-        return samples
-
-    def decode(self, samples_in):
-        try:
-            memory_used = self.memory_used_decode(samples_in.shape, self.vae_dtype)
-            model_management.load_models_gpu([self.patcher], memory_required=memory_used)
-            free_memory = model_management.get_free_memory(self.device)
-            batch_number = int(free_memory / memory_used)
-            batch_number = max(1, batch_number)
 
-            pixel_samples = torch.empty((samples_in.shape[0], 3, round(samples_in.shape[2] * self.upscale_ratio), round(samples_in.shape[3] * self.upscale_ratio)), device=self.output_device)
-            for x in range(0, samples_in.shape[0], batch_number):
-                samples = samples_in[x:x+batch_number].to(self.vae_dtype).to(self.device)
-                pixel_samples[x:x+batch_number] = self.process_output(self.first_stage_model.decode(samples).to(self.output_device).float())
-        except model_management.OOM_EXCEPTION as e:
-            logging.warning("Warning: Ran out of memory when regular VAE decoding, retrying with tiled VAE decoding.")
-            pixel_samples = self.decode_tiled_(samples_in)
+        def run(tile_batch):
+            pbar = comfy.utils.ProgressBar(steps)
+            samples = comfy.utils.tiled_scale(pixel_samples, encode_fn, tile_x, tile_y, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar, tile_batch=tile_batch)
+            if mode == "single_pass":
+                return samples
+            samples += comfy.utils.tiled_scale(pixel_samples, encode_fn, tile_x * 2, tile_y // 2, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar, tile_batch=tile_batch)
+            samples += comfy.utils.tiled_scale(pixel_samples, encode_fn, tile_x // 2, tile_y * 2, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar, tile_batch=tile_batch)
+            samples /= 3.0
+            return samples
+        return self.run_tiled(run, tile_batch)
+
+    def decode_iter(self, samples_in):
+        """Decodes samples_in as many samples at a time as fit in memory and yields each decoded (batch, height, width,
+        channels) sub-batch on the output device as soon as it is done."""
+        memory_used = self.memory_used_decode(samples_in.shape, self.vae_dtype)
+        model_management.load_models_gpu([self.patcher], memory_required=memory_used)
+        free_memory = model_management.get_free_memory(self.device)
+        batch_number = int(free_memory / memory_used)
+        batch_number = max(1, batch_number)
+
+        tiled = False
+        for x in range(0, samples_in.shape[0], batch_number):
+            if not tiled:
+                try:
+                    samples = samples_in[x:x+batch_number].to(self.vae_dtype).to(self.device)
+                    pixel_samples = self.process_output(self.first_stage_model.decode(samples).to(self.output_device).float())
+                except model_management.OOM_EXCEPTION as e:
+                    logging.warning("Warning: Ran out of memory when regular VAE decoding, retrying with tiled VAE decoding.")
+                    tiled = True
+            if tiled:
+                pixel_samples = self.decode_tiled_(samples_in[x:x+batch_number])
+            yield pixel_samples.to(self.output_device).movedim(1,-1)
 
-        pixel_samples = pixel_samples.to(self.output_device).movedim(1,-1)
+    def decode(self, samples_in):
+        pixel_samples = None
+        x = 0
+        for images in self.decode_iter(samples_in):
+            if pixel_samples is None:
+                pixel_samples = torch.empty((samples_in.shape[0],) + images.shape[1:], device=self.output_device)
+            pixel_samples[x:x+images.shape[0]] = images
+            x += images.shape[0]
         return pixel_samples
 
-    def decode_tiled(self, samples, tile_x=64, tile_y=64, overlap = 16):
+    def decode_tiled(self, samples, tile_x=64, tile_y=64, overlap = 16, mode="three_pass"):
         model_management.load_model_gpu(self.patcher)
-        output = self.decode_tiled_(samples, tile_x, tile_y, overlap)
+        output = self.decode_tiled_(samples, tile_x, tile_y, overlap, mode=mode)
         return output.movedim(1,-1)
 
     def encode(self, pixel_samples):
@@ -323,16 +362,28 @@ class VAE:
 
         return samples
 
-    def encode_tiled(self, pixel_samples, tile_x=512, tile_y=512, overlap = 64):
+    def encode_tiled(self, pixel_samples, tile_x=512, tile_y=512, overlap = 64, mode="three_pass"):
         pixel_samples = self.vae_encode_crop_pixels(pixel_samples)
         model_management.load_model_gpu(self.patcher)
         pixel_samples = pixel_samples.movedim(-1,1)
-        samples = self.encode_tiled_(pixel_samples, tile_x=tile_x, tile_y=tile_y, overlap=overlap)
+        samples = self.encode_tiled_(pixel_samples, tile_x=tile_x, tile_y=tile_y, overlap=overlap, mode=mode)
         return samples
 
     def get_sd(self):
         return self.first_stage_model.state_dict()
 
+class DecodeStream:
+    """IMAGE_STREAM: the images of samples decoded by a VAE one sub-batch at a time, every time it is iterated."""
+    def __init__(self, vae, samples):
+        self.vae = vae
+        self.samples = samples
+
+    def __iter__(self):
+        return self.vae.decode_iter(self.samples)
+
+    def __len__(self):
+        return self.samples.shape[0]
+
 class StyleModel:
     def __init__(self, model, device="cpu"):
         self.model = model
@@ -443,7 +494,7 @@ def load_checkpoint(config_path=None, ckpt_path=None, output_vae=True, output_cl
         pass
 
     if state_dict is None:
-        state_dict = comfy.utils.load_torch_file(ckpt_path)
+        state_dict = comfy.utils.load_torch_file(ckpt_path, lazy=True)
 
     class EmptyClass:
         pass
@@ -492,7 +543,7 @@ def load_checkpoint(config_path=None, ckpt_path=None, output_vae=True, output_cl
     return (comfy.model_patcher.ModelPatcher(model, load_device=model_management.get_torch_device(), offload_device=offload_device), clip, vae)
 
 def load_checkpoint_guess_config(ckpt_path, output_vae=True, output_clip=True, output_clipvision=False, embedding_directory=None, output_model=True):
-    sd = comfy.utils.load_torch_file(ckpt_path)
+    sd = comfy.utils.load_torch_file(ckpt_path, lazy=True)
     sd_keys = sd.keys()
     clip = None
     clipvision = None
@@ -600,7 +651,7 @@ def load_unet(unet_path):
         raise RuntimeError("ERROR: Could not detect model type of: {}".format(unet_path))
     return model
 
-def save_checkpoint(output_path, model, clip=None, vae=None, clip_vision=None, metadata=None):
+def save_checkpoint(output_path, model, clip=None, vae=None, clip_vision=None, metadata=None, dtype=None):
     clip_sd = None
     load_models = [model]
     if clip is not None:
@@ -609,5 +660,8 @@ def save_checkpoint(output_path, model, clip=None, vae=None, clip_vision=None, m
 
     model_management.load_models_gpu(load_models)
     clip_vision_sd = clip_vision.get_sd() if clip_vision is not None else None
-    sd = model.model.state_dict_for_saving(clip_sd, vae.get_sd(), clip_vision_sd)
-    comfy.utils.save_torch_file(sd, output_path, metadata=metadata)
+    dtypes = {}
+    sd = model.model.state_dict_for_saving(clip_sd, vae.get_sd(), clip_vision_sd, dtypes=dtypes)
+    if dtype is not None:
+        dtypes = {}
+    comfy.utils.save_torch_file(sd, output_path, metadata=metadata, dtype=dtype, dtypes=dtypes)
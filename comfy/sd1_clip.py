@@ -4,9 +4,12 @@ from transformers import CLIPTokenizer
 import comfy.ops
 import torch
 import traceback
+import threading
 import zipfile
 from . import model_management
 import comfy.clip_model
+import comfy.utils
+from comfy.cli_args import args
 import json
 import logging
 
@@ -283,37 +286,71 @@ def expand_directory_list(directories):
             dirs.add(root)
     return list(dirs)
 
-def load_embed(embedding_name, embedding_directory, embedding_size, embed_key=None):
-    if isinstance(embedding_directory, str):
-        embedding_directory = [embedding_directory]
-
-    embedding_directory = expand_directory_list(embedding_directory)
+def mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
 
-    valid_file = None
-    for embed_dir in embedding_directory:
-        embed_path = os.path.abspath(os.path.join(embed_dir, embedding_name))
-        embed_dir = os.path.abspath(embed_dir)
-        try:
-            if os.path.commonpath((embed_dir, embed_path)) != embed_dir:
+class EmbeddingIndex:
+    #files in the embedding directories and their subdirectories, walked again only when the mtime of one of the
+    #directories changed so that resolving embedding names doesn't hit the filesystem for every prompt
+    def __init__(self, directories):
+        self.directories = directories
+        self.lock = threading.Lock()
+        self.files = None
+        self.state = None
+
+    def refresh(self):
+        with self.lock:
+            if self.files is not None and tuple(map(mtime_ns, self.files)) == self.state:
+                return self.state
+            files = {}
+            for x in self.directories:
+                files.setdefault(os.path.abspath(x), set())
+                for root, subdir, file in os.walk(x, followlinks=True):
+                    files.setdefault(os.path.abspath(root), set()).update(file)
+            self.files = files
+            self.state = tuple(map(mtime_ns, files))
+            return self.state
+
+    def isfile(self, path):
+        return os.path.basename(path) in self.files.get(os.path.dirname(path), ()) and os.path.isfile(path)
+
+    def find(self, embedding_name):
+        self.refresh()
+        for embed_dir in self.files:
+            embed_path = os.path.abspath(os.path.join(embed_dir, embedding_name))
+            try:
+                if os.path.commonpath((embed_dir, embed_path)) != embed_dir:
+                    continue
+            except:
                 continue
-        except:
-            continue
-        if not os.path.isfile(embed_path):
-            extensions = ['.safetensors', '.pt', '.bin']
-            for x in extensions:
-                t = embed_path + x
-                if os.path.isfile(t):
-                    valid_file = t
-                    break
-        else:
-            valid_file = embed_path
-        if valid_file is not None:
-            break
-
-    if valid_file is None:
+            if self.isfile(embed_path):
+                return embed_path
+            for x in ['.safetensors', '.pt', '.bin']:
+                if self.isfile(embed_path + x):
+                    return embed_path + x
         return None
 
-    embed_path = valid_file
+embedding_indexes = {}
+embedding_indexes_lock = threading.Lock()
+
+def embedding_index(embedding_directory):
+    if isinstance(embedding_directory, str):
+        embedding_directory = [embedding_directory]
+    key = tuple(embedding_directory)
+    with embedding_indexes_lock:
+        if key not in embedding_indexes:
+            embedding_indexes[key] = EmbeddingIndex(key)
+        return embedding_indexes[key]
+
+def load_embed(embedding_name, embedding_directory, embedding_size, embed_key=None, used_files=None):
+    embed_path = embedding_index(embedding_directory).find(embedding_name)
+    if embed_path is None:
+        return None
+    if used_files is not None:
+        used_files.append((embed_path, os.stat(embed_path).st_mtime_ns))
 
     embed_out = None
 
@@ -380,17 +417,18 @@ class SDTokenizer:
         self.embedding_identifier = "embedding:"
         self.embedding_size = embedding_size
         self.embedding_key = embedding_key
+        self.tokenize_cache = comfy.utils.LRUCache(args.tokenizer_cache_size)
 
-    def _try_get_embedding(self, embedding_name:str):
+    def _try_get_embedding(self, embedding_name:str, used_files=None):
         '''
         Takes a potential embedding name and tries to retrieve it.
         Returns a Tuple consisting of the embedding and any leftover string, embedding can be None.
         '''
-        embed = load_embed(embedding_name, self.embedding_directory, self.embedding_size, self.embedding_key)
+        embed = load_embed(embedding_name, self.embedding_directory, self.embedding_size, self.embedding_key, used_files)
         if embed is None:
             stripped = embedding_name.strip(',')
             if len(stripped) < len(embedding_name):
-                embed = load_embed(stripped, self.embedding_directory, self.embedding_size, self.embedding_key)
+                embed = load_embed(stripped, self.embedding_directory, self.embedding_size, self.embedding_key, used_files)
                 return (embed, embedding_name[len(stripped):])
         return (embed, "")
 
@@ -402,6 +440,24 @@ class SDTokenizer:
         Word id values are unique per word and embedding, where the id 0 is reserved for non word tokens.
         Returned list has the dimensions NxM where M is the input size of CLIP
         '''
+        if self.tokenize_cache.budget <= 0:
+            return self._tokenize_with_weights(text, return_word_ids)
+
+        embeddings_state = None
+        if self.embedding_directory is not None and self.embedding_identifier in text:
+            embeddings_state = embedding_index(self.embedding_directory).refresh()
+        key = (text, return_word_ids, embeddings_state, self.max_length, self.min_length, self.pad_with_end, self.pad_to_max_length, self.embedding_size, self.embedding_key)
+        cached = self.tokenize_cache.get(key)
+        if cached is not None and all(mtime_ns(path) == mtime for path, mtime in cached[1]):
+            batched_tokens = cached[0]
+        else:
+            used_files = []
+            batched_tokens = self._tokenize_with_weights(text, return_word_ids, used_files)
+            self.tokenize_cache.put(key, (batched_tokens, tuple(used_files)))
+        #callers extend the returned batches
+        return [list(x) for x in batched_tokens]
+
+    def _tokenize_with_weights(self, text, return_word_ids=False, used_files=None):
         if self.pad_with_end:
             pad_token = self.end_token
         else:
@@ -419,7 +475,7 @@ class SDTokenizer:
                 #if we find an embedding, deal with the embedding
                 if word.startswith(self.embedding_identifier) and self.embedding_directory is not None:
                     embedding_name = word[len(self.embedding_identifier):].strip('\n')
-                    embed, leftover = self._try_get_embedding(embedding_name)
+                    embed, leftover = self._try_get_embedding(embedding_name, used_files)
                     if embed is None:
                         logging.warning(f"warning, embedding:{embedding_name} does not exist, ignoring")
                     else:
@@ -1,3 +1,5 @@
+import os
+import json
 import torch
 import math
 import struct
@@ -6,12 +8,169 @@ import safetensors.torch
 import numpy as np
 from PIL import Image
 import logging
+import collections
+import collections.abc
+import threading
+
+class LazySafetensorsDict(collections.abc.MutableMapping):
+    """Dict-like view over a memory mapped safetensors file.
+
+    Tensors are only read from the file when they are accessed, keys can be renamed or moved
+    to another view sharing the same file without touching the data.
+    """
+    class Ref:
+        __slots__ = ("key",)
+        def __init__(self, key):
+            self.key = key
+
+    def __init__(self, ckpt, device="cpu", handle=None):
+        if handle is None:
+            handle = safetensors.safe_open(ckpt, framework="pt", device=device)
+            self.entries = {k: LazySafetensorsDict.Ref(k) for k in handle.keys()}
+        else:
+            self.entries = {}
+        self.ckpt = ckpt
+        self.device = device
+        self.handle = handle
+
+    def empty_like(self):
+        return LazySafetensorsDict(self.ckpt, self.device, handle=self.handle)
+
+    def copy(self):
+        out = self.empty_like()
+        out.entries = self.entries.copy()
+        return out
+
+    def is_lazy(self, key):
+        return isinstance(self.entries[key], LazySafetensorsDict.Ref)
+
+    def shape(self, key):
+        v = self.entries[key]
+        if isinstance(v, LazySafetensorsDict.Ref):
+            return torch.Size(self.handle.get_slice(v.key).get_shape())
+        return v.shape
+
+    def nelement(self, key):
+        return math.prod(self.shape(key))
+
+    def dtype(self, key):
+        v = self.entries[key]
+        if isinstance(v, LazySafetensorsDict.Ref):
+            return SAFETENSORS_DTYPES_INV[self.handle.get_slice(v.key).get_dtype()]
+        return v.dtype
+
+    def metadata(self):
+        return self.handle.metadata()
+
+    def __getitem__(self, key):
+        v = self.entries[key]
+        if isinstance(v, LazySafetensorsDict.Ref):
+            return self.handle.get_tensor(v.key)
+        return v
+
+    def __setitem__(self, key, value):
+        self.entries[key] = value
+
+    def __delitem__(self, key):
+        del self.entries[key]
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+class LRUCache:
+    """Thread safe LRU mapping bounded by the total size of its values (in bytes when used with tensors or models)."""
+    def __init__(self, budget, size_function=lambda a: 1, on_evict=None):
+        self.budget = budget
+        self.size_function = size_function
+        self.on_evict = on_evict
+        self.entries = collections.OrderedDict()
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.resident_bytes = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def put(self, key, value, size=None):
+        if size is None:
+            size = self.size_function(value)
+        with self.lock:
+            if size > self.budget:
+                return False
+            self.discard(key)
+            self.entries[key] = (value, size)
+            self.resident_bytes += size
+            self.evict(self.budget)
+        return True
+
+    def discard(self, key):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.resident_bytes -= old[1]
+                return old[0]
+        return None
+
+    def evict(self, budget):
+        with self.lock:
+            while self.resident_bytes > budget and len(self.entries) > 0:
+                key, (value, size) = self.entries.popitem(last=False)
+                self.resident_bytes -= size
+                self.evictions += 1
+                if self.on_evict is not None:
+                    self.on_evict(key, value)
+
+    def set_budget(self, budget):
+        with self.lock:
+            self.budget = budget
+            self.evict(budget)
+
+    def clear(self):
+        self.evict(-1)
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": len(self.entries), "resident_bytes": self.resident_bytes, "budget_bytes": self.budget}
+
+def move_state_dict_key(state_dict, key_from, key_to, out=None):
+    #renames a key (into out if specified) without loading the tensor when the state dict is lazy
+    if out is None:
+        out = state_dict
+    if isinstance(state_dict, LazySafetensorsDict) and isinstance(out, LazySafetensorsDict) and state_dict.handle is out.handle:
+        out.entries[key_to] = state_dict.entries.pop(key_from)
+    else:
+        out[key_to] = state_dict.pop(key_from)
 
-def load_torch_file(ckpt, safe_load=False, device=None):
+def load_torch_file(ckpt, safe_load=False, device=None, lazy=False):
     if device is None:
         device = torch.device("cpu")
     if ckpt.lower().endswith(".safetensors"):
-        sd = safetensors.torch.load_file(ckpt, device=device.type)
+        if lazy:
+            sd = LazySafetensorsDict(ckpt, device=device.type)
+        else:
+            sd = safetensors.torch.load_file(ckpt, device=device.type)
     else:
         if safe_load:
             if not 'weights_only' in torch.load.__code__.co_varnames:
@@ -29,35 +188,132 @@ def load_torch_file(ckpt, safe_load=False, device=None):
             sd = pl_sd
     return sd
 
-def save_torch_file(sd, ckpt, metadata=None):
-    if metadata is not None:
-        safetensors.torch.save_file(sd, ckpt, metadata=metadata)
-    else:
-        safetensors.torch.save_file(sd, ckpt)
+SAFETENSORS_DTYPES = {torch.float64: "F64", torch.float32: "F32", torch.float16: "F16", torch.bfloat16: "BF16",
+                      torch.int64: "I64", torch.int32: "I32", torch.int16: "I16", torch.int8: "I8", torch.uint8: "U8", torch.bool: "BOOL"}
+if hasattr(torch, "float8_e4m3fn"):
+    SAFETENSORS_DTYPES[torch.float8_e4m3fn] = "F8_E4M3"
+    SAFETENSORS_DTYPES[torch.float8_e5m2] = "F8_E5M2"
+SAFETENSORS_DTYPES_INV = {v: k for k, v in SAFETENSORS_DTYPES.items()}
+
+class SafetensorsWriter:
+    """Writes a safetensors file one tensor at a time.
+
+    The header is built upfront from the (key, shape, dtype) list, the tensors are then passed to write in the
+    same order and their bytes go straight to the file so only one tensor needs to be in memory.
+    """
+    def __init__(self, path, tensors, metadata=None):
+        header = {}
+        if metadata is not None:
+            header["__metadata__"] = metadata
+        offset = 0
+        self.tensors = []
+        for k, shape, dtype in tensors:
+            shape = torch.Size(shape)
+            size = math.prod(shape) * torch.empty((), dtype=dtype).element_size()
+            header[k] = {"dtype": SAFETENSORS_DTYPES[dtype], "shape": list(shape), "data_offsets": [offset, offset + size]}
+            self.tensors.append((k, shape, dtype))
+            offset += size
+        header = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        header += b" " * (-len(header) % 8)
+
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.index = 0
+        self.file = open(self.tmp_path, "wb")
+        self.file.write(struct.pack("<Q", len(header)))
+        self.file.write(header)
+
+    def write(self, key, tensor):
+        k, shape, dtype = self.tensors[self.index]
+        if key != k or tensor.shape != shape:
+            raise ValueError("expected tensor {} {} but got {} {}".format(k, list(shape), key, list(tensor.shape)))
+        tensor = tensor.to(device="cpu", dtype=dtype).contiguous()
+        self.file.write(tensor.reshape(-1).view(torch.uint8).numpy().data)
+        self.index += 1
+
+    def close(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        if self.index != len(self.tensors):
+            os.remove(self.tmp_path)
+            raise ValueError("only {} of the {} tensors were written to {}".format(self.index, len(self.tensors), self.path))
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def state_dict_shape(sd, key):
+    if isinstance(sd, LazySafetensorsDict):
+        return sd.shape(key)
+    return sd[key].shape
+
+def state_dict_dtype(sd, key):
+    if isinstance(sd, LazySafetensorsDict):
+        return sd.dtype(key)
+    return sd[key].dtype
+
+def save_torch_file(sd, ckpt, metadata=None, dtype=None, dtypes=None):
+    #tensors are streamed to the file one at a time instead of serializing the whole state dict in memory first
+    #dtype converts the floating point tensors, dtypes maps keys to the dtype they are saved in
+    if dtypes is None:
+        dtypes = {}
+
+    def save_dtype(k):
+        if k in dtypes:
+            return dtypes[k]
+        d = state_dict_dtype(sd, k)
+        if dtype is not None and d.is_floating_point:
+            return dtype
+        return d
+
+    keys = list(sd.keys())
+    with SafetensorsWriter(ckpt, [(k, state_dict_shape(sd, k), save_dtype(k)) for k in keys], metadata) as writer:
+        for k in keys:
+            writer.write(k, sd[k])
 
 def calculate_parameters(sd, prefix=""):
     params = 0
+    lazy = isinstance(sd, LazySafetensorsDict)
     for k in sd.keys():
         if k.startswith(prefix):
-            params += sd[k].nelement()
+            if lazy:
+                params += sd.nelement(k)
+            else:
+                params += sd[k].nelement()
     return params
 
 def state_dict_key_replace(state_dict, keys_to_replace):
     for x in keys_to_replace:
         if x in state_dict:
-            state_dict[keys_to_replace[x]] = state_dict.pop(x)
+            move_state_dict_key(state_dict, x, keys_to_replace[x])
     return state_dict
 
 def state_dict_prefix_replace(state_dict, replace_prefix, filter_keys=False):
     if filter_keys:
-        out = {}
+        if isinstance(state_dict, LazySafetensorsDict):
+            out = state_dict.empty_like()
+        else:
+            out = {}
     else:
         out = state_dict
     for rp in replace_prefix:
         replace = list(map(lambda a: (a, "{}{}".format(replace_prefix[rp], a[len(rp):])), filter(lambda a: a.startswith(rp), state_dict.keys())))
         for x in replace:
-            w = state_dict.pop(x[0])
-            out[x[1]] = w
+            move_state_dict_key(state_dict, x[0], x[1], out)
     return out
 
 
@@ -72,7 +328,7 @@ def transformers_convert(sd, prefix_from, prefix_to, number):
     for k in keys_to_replace:
         x = k.format(prefix_from)
         if x in sd:
-            sd[keys_to_replace[k].format(prefix_to)] = sd.pop(x)
+            move_state_dict_key(sd, x, keys_to_replace[k].format(prefix_to))
 
     resblock_to_replace = {
         "ln_1": "layer_norm1",
@@ -88,7 +344,7 @@ def transformers_convert(sd, prefix_from, prefix_to, number):
                 k = "{}transformer.resblocks.{}.{}.{}".format(prefix_from, resblock, x, y)
                 k_to = "{}encoder.layers.{}.{}.{}".format(prefix_to, resblock, resblock_to_replace[x], y)
                 if k in sd:
-                    sd[k_to] = sd.pop(k)
+                    move_state_dict_key(sd, k, k_to)
 
         for y in ["weight", "bias"]:
             k_from = "{}transformer.resblocks.{}.attn.in_proj_{}".format(prefix_from, resblock, y)
@@ -107,7 +363,7 @@ def clip_text_transformers_convert(sd, prefix_from, prefix_to):
 
     tp = "{}text_projection.weight".format(prefix_from)
     if tp in sd:
-        sd["{}text_projection.weight".format(prefix_to)] = sd.pop(tp)
+        move_state_dict_key(sd, tp, "{}text_projection.weight".format(prefix_to))
 
     tp = "{}text_projection".format(prefix_from)
     if tp in sd:
@@ -424,31 +680,70 @@ def common_upscale(samples, width, height, upscale_method, crop):
 def get_tiled_scale_steps(width, height, tile_x, tile_y, overlap):
     return math.ceil((height / (tile_y - overlap))) * math.ceil((width / (tile_x - overlap)))
 
+def feather_ramp(length, feather, start=True, end=True):
+    if feather <= 0:
+        return torch.ones(length, dtype=torch.float64)
+    ramp = torch.arange(1, feather + 1, dtype=torch.float64) * (1.0 / feather)
+    out = torch.ones(length, dtype=torch.float64)
+    n = min(feather, length)
+    if start:
+        out[:n] *= ramp[:n]
+    if end:
+        out[length - n:] *= ramp[:n].flip(0)
+    return out
+
+feather_mask_cache = LRUCache(64 * 1024 * 1024, lambda t: t.nelement() * t.element_size())
+
+def feather_mask(height, width, feather, edges=(True, True, True, True), device="cpu", dtype=torch.float32):
+    """(height, width) blend mask whose (top, bottom, left, right) edges ramp linearly from 1/feather up to 1.
+
+    The mask is the outer product of a row and a column ramp and is cached, it must not be modified in place.
+    """
+    if feather <= 0:
+        #no overlap to blend, like the old feather loop that did nothing
+        return torch.ones((height, width), device=device, dtype=dtype)
+    key = (height, width, feather, tuple(edges), str(device), dtype)
+    mask = feather_mask_cache.get(key)
+    if mask is None:
+        top, bottom, left, right = edges
+        mask = torch.outer(feather_ramp(height, feather, top, bottom), feather_ramp(width, feather, left, right)).to(device=device, dtype=dtype)
+        feather_mask_cache.put(key, mask)
+    return mask
+
+MAX_TILE_BATCH = 16
+
+def tile_batch_size(free_memory, memory_per_tile):
+    return max(1, min(MAX_TILE_BATCH, int(free_memory // max(1, memory_per_tile))))
+
 @torch.inference_mode()
-def tiled_scale(samples, function, tile_x=64, tile_y=64, overlap = 8, upscale_amount = 4, out_channels = 3, output_device="cpu", pbar = None):
+def tiled_scale(samples, function, tile_x=64, tile_y=64, overlap = 8, upscale_amount = 4, out_channels = 3, output_device="cpu", pbar = None, tile_batch = 1):
+    #tiles with the same shape (all of them except the ones cut by the right and bottom borders) are run through
+    #function up to tile_batch at a time
     output = torch.empty((samples.shape[0], out_channels, round(samples.shape[2] * upscale_amount), round(samples.shape[3] * upscale_amount)), device=output_device)
     for b in range(samples.shape[0]):
         s = samples[b:b+1]
         out = torch.zeros((s.shape[0], out_channels, round(s.shape[2] * upscale_amount), round(s.shape[3] * upscale_amount)), device=output_device)
         out_div = torch.zeros((s.shape[0], out_channels, round(s.shape[2] * upscale_amount), round(s.shape[3] * upscale_amount)), device=output_device)
+        tiles = {}
         for y in range(0, s.shape[2], tile_y - overlap):
             for x in range(0, s.shape[3], tile_x - overlap):
                 x = max(0, min(s.shape[-1] - overlap, x))
                 y = max(0, min(s.shape[-2] - overlap, y))
-                s_in = s[:,:,y:y+tile_y,x:x+tile_x]
+                tiles.setdefault(s[:,:,y:y+tile_y,x:x+tile_x].shape, []).append((x, y))
+
+        for positions in tiles.values():
+            for i in range(0, len(positions), tile_batch):
+                batch = positions[i:i+tile_batch]
+                s_in = torch.cat([s[:,:,y:y+tile_y,x:x+tile_x] for x, y in batch])
 
                 ps = function(s_in).to(output_device)
-                mask = torch.ones_like(ps)
                 feather = round(overlap * upscale_amount)
-                for t in range(feather):
-                        mask[:,:,t:1+t,:] *= ((1.0/feather) * (t + 1))
-                        mask[:,:,mask.shape[2] -1 -t: mask.shape[2]-t,:] *= ((1.0/feather) * (t + 1))
-                        mask[:,:,:,t:1+t] *= ((1.0/feather) * (t + 1))
-                        mask[:,:,:,mask.shape[3]- 1 - t: mask.shape[3]- t] *= ((1.0/feather) * (t + 1))
-                out[:,:,round(y*upscale_amount):round((y+tile_y)*upscale_amount),round(x*upscale_amount):round((x+tile_x)*upscale_amount)] += ps * mask
-                out_div[:,:,round(y*upscale_amount):round((y+tile_y)*upscale_amount),round(x*upscale_amount):round((x+tile_x)*upscale_amount)] += mask
-                if pbar is not None:
-                    pbar.update(1)
+                mask = feather_mask(ps.shape[2], ps.shape[3], feather, device=ps.device, dtype=ps.dtype)
+                for j, (x, y) in enumerate(batch):
+                    out[:,:,round(y*upscale_amount):round((y+tile_y)*upscale_amount),round(x*upscale_amount):round((x+tile_x)*upscale_amount)] += ps[j:j+1] * mask
+                    out_div[:,:,round(y*upscale_amount):round((y+tile_y)*upscale_amount),round(x*upscale_amount):round((x+tile_x)*upscale_amount)] += mask
+                    if pbar is not None:
+                        pbar.update(1)
 
         output[b:b+1] = out/out_div
     return output
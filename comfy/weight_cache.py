@@ -0,0 +1,61 @@
+import os
+import hashlib
+import logging
+import torch
+import safetensors.torch
+
+import comfy.utils
+from comfy.cli_args import args
+
+#Stores weights merged by ModelPatcher.patch_model so that repeated LoRA stacks skip calculate_weight.
+#Entries evicted from RAM are spilled to --lora-weight-cache-dir when it is set.
+
+def tensor_size(t):
+    return t.nelement() * t.element_size()
+
+def spill_path(key):
+    return os.path.join(args.lora_weight_cache_dir, "{}.safetensors".format(hashlib.sha256(repr(key).encode()).hexdigest()))
+
+def remove_spilled(key, path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def spill(key, weight):
+    path = spill_path(key)
+    try:
+        os.makedirs(args.lora_weight_cache_dir, exist_ok=True)
+        comfy.utils.save_torch_file({"weight": weight.contiguous()}, path)
+        disk_cache.put(key, path, os.path.getsize(path))
+    except Exception as e:
+        logging.warning("could not spill merged weight to disk: {}".format(e))
+
+weight_cache_budget = int(args.lora_weight_cache_ram * (1024 ** 3))
+
+disk_cache = comfy.utils.LRUCache(int(args.lora_weight_cache_disk_size * (1024 ** 3)), on_evict=remove_spilled)
+cache = comfy.utils.LRUCache(weight_cache_budget, tensor_size, on_evict=spill if args.lora_weight_cache_dir is not None else None)
+
+def enabled():
+    return cache.budget > 0
+
+def get(key):
+    weight = cache.get(key)
+    if weight is None and args.lora_weight_cache_dir is not None:
+        path = disk_cache.discard(key)
+        if path is not None:
+            try:
+                weight = safetensors.torch.load_file(path)["weight"]
+                cache.put(key, weight)
+            except Exception as e:
+                logging.warning("could not load spilled merged weight: {}".format(e))
+            remove_spilled(key, path)
+    return weight
+
+def put(key, weight):
+    return cache.put(key, weight.to(device="cpu", copy=True))
+
+def stats():
+    out = cache.stats()
+    out["disk"] = disk_cache.stats()
+    return out
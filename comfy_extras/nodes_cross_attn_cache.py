@@ -0,0 +1,23 @@
+class CrossAttentionKVCache:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": {"model": ("MODEL",),
+                             "enabled": ("BOOLEAN", {"default": True}),
+                            }}
+    RETURN_TYPES = ("MODEL",)
+    FUNCTION = "patch"
+
+    CATEGORY = "advanced/model"
+
+    def patch(self, model, enabled):
+        m = model.clone()
+        m.set_model_cross_attn_kv_cache(enabled)
+        return (m, )
+
+
+NODE_CLASS_MAPPINGS = {
+    "CrossAttentionKVCache": CrossAttentionKVCache,
+}
+NODE_DISPLAY_NAME_MAPPINGS = {
+    "CrossAttentionKVCache": "Cross Attention K/V Cache",
+}
@@ -7,6 +7,7 @@ from PIL.PngImagePlugin import PngInfo
 
 import numpy as np
 import json
+import math
 import os
 
 MAX_RESOLUTION = nodes.MAX_RESOLUTION
@@ -98,31 +99,14 @@ class SaveAnimatedWEBP:
     def save_images(self, images, fps, filename_prefix, lossless, quality, method, num_frames=0, prompt=None, extra_pnginfo=None):
         method = self.methods.get(method)
         filename_prefix += self.prefix_append
-        full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir, images[0].shape[1], images[0].shape[0])
         results = list()
         pil_images = []
-        for image in images:
-            i = 255. * image.cpu().numpy()
-            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-            pil_images.append(img)
-
-        metadata = pil_images[0].getexif()
-        if not args.disable_metadata:
-            if prompt is not None:
-                metadata[0x0110] = "prompt:{}".format(json.dumps(prompt))
-            if extra_pnginfo is not None:
-                inital_exif = 0x010f
-                for x in extra_pnginfo:
-                    metadata[inital_exif] = "{}:{}".format(x, json.dumps(extra_pnginfo[x]))
-                    inital_exif -= 1
-
-        if num_frames == 0:
-            num_frames = len(pil_images)
+        metadata = None
 
-        c = len(pil_images)
-        for i in range(0, c, num_frames):
+        def save(frames):
+            nonlocal counter
             file = f"{filename}_{counter:05}_.webp"
-            pil_images[i].save(os.path.join(full_output_folder, file), save_all=True, duration=int(1000.0/fps), append_images=pil_images[i + 1:i + num_frames], exif=metadata, lossless=lossless, quality=quality, method=method)
+            frames[0].save(os.path.join(full_output_folder, file), save_all=True, duration=int(1000.0/fps), append_images=frames[1:], exif=metadata, lossless=lossless, quality=quality, method=method)
             results.append({
                 "filename": file,
                 "subfolder": subfolder,
@@ -130,9 +114,49 @@ class SaveAnimatedWEBP:
             })
             counter += 1
 
+        # frames are converted as they come in and each file is written as soon as it has num_frames frames
+        for image in nodes.iter_images(images):
+            if metadata is None:
+                # one counter per file written, images is an IMAGE tensor or a stream that knows its length
+                count = math.ceil(len(images) / num_frames) if num_frames > 0 else 1
+                full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir, image.shape[1], image.shape[0], count)
+            i = 255. * image.cpu().numpy()
+            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
+            pil_images.append(img)
+
+            if metadata is None:
+                metadata = pil_images[0].getexif()
+                if not args.disable_metadata:
+                    if prompt is not None:
+                        metadata[0x0110] = "prompt:{}".format(json.dumps(prompt))
+                    if extra_pnginfo is not None:
+                        inital_exif = 0x010f
+                        for x in extra_pnginfo:
+                            metadata[inital_exif] = "{}:{}".format(x, json.dumps(extra_pnginfo[x]))
+                            inital_exif -= 1
+
+            if num_frames > 0 and len(pil_images) == num_frames:
+                save(pil_images)
+                pil_images = []
+
+        if num_frames == 0:
+            num_frames = len(pil_images)
+        if len(pil_images) > 0:
+            save(pil_images)
+        if len(results) > 0:
+            folder_paths.save_counter_used(full_output_folder, filename, counter - 1)
+
         animated = num_frames != 1
         return { "ui": { "images": results, "animated": (animated,) } }
 
+class SaveAnimatedWEBPStream(SaveAnimatedWEBP):
+    # SaveAnimatedWEBP consuming an IMAGE_STREAM, frames are encoded while the rest of the batch is still being decoded
+    @classmethod
+    def INPUT_TYPES(s):
+        input_types = SaveAnimatedWEBP.INPUT_TYPES()
+        input_types["required"]["images"] = ("IMAGE_STREAM",)
+        return input_types
+
 class SaveAnimatedPNG:
     def __init__(self):
         self.output_dir = folder_paths.get_output_directory()
@@ -191,5 +215,6 @@ NODE_CLASS_MAPPINGS = {
     "RepeatImageBatch": RepeatImageBatch,
     "ImageFromBatch": ImageFromBatch,
     "SaveAnimatedWEBP": SaveAnimatedWEBP,
+    "SaveAnimatedWEBPStream": SaveAnimatedWEBPStream,
     "SaveAnimatedPNG": SaveAnimatedPNG,
 }
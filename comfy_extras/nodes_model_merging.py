@@ -2,6 +2,7 @@ import comfy.sd
 import comfy.utils
 import comfy.model_base
 import comfy.model_management
+import comfy.checkpoint_merge
 
 import folder_paths
 import json
@@ -151,15 +152,7 @@ class ModelMergeBlocks:
         default_ratio = next(iter(kwargs.values()))
 
         for k in kp:
-            ratio = default_ratio
-            k_unet = k[len("diffusion_model."):]
-
-            last_arg_size = 0
-            for arg in kwargs:
-                if k_unet.startswith(arg) and last_arg_size < len(arg):
-                    ratio = kwargs[arg]
-                    last_arg_size = len(arg)
-
+            ratio = comfy.checkpoint_merge.block_ratio(k[len("diffusion_model."):], kwargs, default_ratio)
             m.add_patches({k: kp[k]}, 1.0 - ratio, ratio)
         return (m, )
 
@@ -316,6 +309,60 @@ class VAESave:
         comfy.utils.save_torch_file(vae.get_sd(), output_checkpoint, metadata=metadata)
         return {}
 
+class CheckpointMergeSave:
+    # merges two checkpoint files straight to disk one weight at a time, without loading either model
+    def __init__(self):
+        self.output_dir = folder_paths.get_output_directory()
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": { "ckpt_name1": (folder_paths.get_filename_list("checkpoints"), ),
+                              "ckpt_name2": (folder_paths.get_filename_list("checkpoints"), ),
+                              "ratio": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.01}),
+                              "filename_prefix": ("STRING", {"default": "checkpoints/ComfyUI"}),},
+                "hidden": {"prompt": "PROMPT", "extra_pnginfo": "EXTRA_PNGINFO"},}
+    RETURN_TYPES = ()
+    FUNCTION = "save"
+    OUTPUT_NODE = True
+
+    CATEGORY = "advanced/model_merging"
+
+    def save(self, ckpt_name1, ckpt_name2, filename_prefix, prompt=None, extra_pnginfo=None, **kwargs):
+        full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir)
+        prompt_info = ""
+        if prompt is not None:
+            prompt_info = json.dumps(prompt)
+
+        metadata = {}
+        if not args.disable_metadata:
+            metadata["prompt"] = prompt_info
+            if extra_pnginfo is not None:
+                for x in extra_pnginfo:
+                    metadata[x] = json.dumps(extra_pnginfo[x])
+
+        output_checkpoint = f"{filename}_{counter:05}_.safetensors"
+        output_checkpoint = os.path.join(full_output_folder, output_checkpoint)
+
+        default_ratio = next(iter(kwargs.values()))
+        comfy.checkpoint_merge.merge_checkpoints(output_checkpoint,
+                                                 folder_paths.get_full_path("checkpoints", ckpt_name1),
+                                                 folder_paths.get_full_path("checkpoints", ckpt_name2),
+                                                 lambda k_unet: comfy.checkpoint_merge.block_ratio(k_unet, kwargs, default_ratio),
+                                                 metadata=metadata)
+        folder_paths.save_counter_used(full_output_folder, filename, counter)
+        return {}
+
+class CheckpointMergeBlocksSave(CheckpointMergeSave):
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": { "ckpt_name1": (folder_paths.get_filename_list("checkpoints"), ),
+                              "ckpt_name2": (folder_paths.get_filename_list("checkpoints"), ),
+                              "input": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.01}),
+                              "middle": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.01}),
+                              "out": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.01}),
+                              "filename_prefix": ("STRING", {"default": "checkpoints/ComfyUI"}),},
+                "hidden": {"prompt": "PROMPT", "extra_pnginfo": "EXTRA_PNGINFO"},}
+
 NODE_CLASS_MAPPINGS = {
     "ModelMergeSimple": ModelMergeSimple,
     "ModelMergeBlocks": ModelMergeBlocks,
@@ -327,4 +374,6 @@ NODE_CLASS_MAPPINGS = {
     "CLIPMergeAdd": CLIPAdd,
     "CLIPSave": CLIPSave,
     "VAESave": VAESave,
+    "CheckpointMergeSave": CheckpointMergeSave,
+    "CheckpointMergeBlocksSave": CheckpointMergeBlocksSave,
 }
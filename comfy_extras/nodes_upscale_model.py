@@ -43,15 +43,20 @@ class ImageUpscaleWithModel:
 
         tile = 512
         overlap = 32
+        tile_memory = (tile * tile * 3) * in_img.element_size() * max(upscale_model.scale, 1.0) * 384.0
+        tile_batch = comfy.utils.tile_batch_size(free_memory, tile_memory)
 
         oom = True
         while oom:
             try:
                 steps = in_img.shape[0] * comfy.utils.get_tiled_scale_steps(in_img.shape[3], in_img.shape[2], tile_x=tile, tile_y=tile, overlap=overlap)
                 pbar = comfy.utils.ProgressBar(steps)
-                s = comfy.utils.tiled_scale(in_img, lambda a: upscale_model(a), tile_x=tile, tile_y=tile, overlap=overlap, upscale_amount=upscale_model.scale, pbar=pbar)
+                s = comfy.utils.tiled_scale(in_img, lambda a: upscale_model(a), tile_x=tile, tile_y=tile, overlap=overlap, upscale_amount=upscale_model.scale, pbar=pbar, tile_batch=tile_batch)
                 oom = False
             except model_management.OOM_EXCEPTION as e:
+                if tile_batch > 1:
+                    tile_batch //= 2
+                    continue
                 tile //= 2
                 if tile < 128:
                     raise e
@@ -63,6 +63,18 @@ export type ComfyUIRemotePlugin = {
   description;
 };
 
+export type ComfyUIPluginJob = {
+  job_id: string;
+  kind: 'install' | 'remove';
+  name: string;
+  status: 'queued' | 'running' | 'succeeded' | 'failed';
+  error: string | null;
+  logs: string[];
+  log_offset: number;
+};
+
+const PLUGIN_JOB_POLL_INTERVAL = 1000;
+
 export function convertRemoteComfyUIPluginToKatzukiPlugin({
   author,
   title,
@@ -148,47 +160,66 @@ export function ComfyUIManager(node: NodeProps) {
     fetchInstalledPluginInfo();
   }, [fetchPluginInfo, fetchInstalledPluginInfo]);
 
-  const onRemove = useCallback(
-    (plugin: ComfyUIPlugin) => {
-      setInstallingOrRemoving(true);
+  // install and remove run as background jobs on the server, poll them until they finish
+  const pollPluginJob = useCallback(
+    (jobId: string, onFinished: (job: ComfyUIPluginJob) => void) => {
       fetchWithCredentials({
-        url: `${HTTP_URL}/ComfyUIManager/plugins/remove`,
+        url: `${HTTP_URL}/ComfyUIManager/plugins/jobs/${jobId}`,
         notificationAPI: notificationAPI,
         onSuccess: (response) => {
-          setInstallingOrRemoving(false);
-          notificationAPI.success({
-            message: 'Plugin Removed',
-            description: `Plugin ${plugin.name} has been removed. Please restart the program for it to take effect.`,
+          response.json().then((job: ComfyUIPluginJob) => {
+            if (job.status === 'succeeded' || job.status === 'failed') {
+              onFinished(job);
+            } else {
+              setTimeout(
+                () => pollPluginJob(jobId, onFinished),
+                PLUGIN_JOB_POLL_INTERVAL,
+              );
+            }
           });
-          fetchPluginInfo();
         },
         onFailed: () => {
           setInstallingOrRemoving(false);
         },
-        options: {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify(plugin),
-        },
+        withoutCredentials: true,
       });
     },
-    [notificationAPI, fetchPluginInfo],
+    [notificationAPI],
   );
-  const onInstall = useCallback(
-    (plugin: ComfyUIPlugin) => {
+
+  const runPluginJob = useCallback(
+    (
+      plugin: ComfyUIPlugin,
+      action: 'install' | 'remove',
+      successMessage: string,
+      successDescription: string,
+    ) => {
       setInstallingOrRemoving(true);
       fetchWithCredentials({
-        url: `${HTTP_URL}/ComfyUIManager/plugins/install`,
+        url: `${HTTP_URL}/ComfyUIManager/plugins/${action}`,
         notificationAPI: notificationAPI,
         onSuccess: (response) => {
-          setInstallingOrRemoving(false);
-          notificationAPI.success({
-            message: 'Plugin Installed',
-            description: `Plugin from ${plugin.name} has been installed. Please restart the program for it to take effect.`,
+          response.json().then(({ job_id }: { job_id: string }) => {
+            pollPluginJob(job_id, (job) => {
+              setInstallingOrRemoving(false);
+              if (job.status === 'succeeded') {
+                notificationAPI.success({
+                  message: successMessage,
+                  description: successDescription,
+                });
+              } else {
+                notificationAPI.error({
+                  message: `Plugin ${action} failed`,
+                  description:
+                    job.error ||
+                    job.logs.slice(-5).join('\n') ||
+                    `Could not ${action} ${plugin.name}.`,
+                });
+              }
+              fetchPluginInfo();
+              fetchInstalledPluginInfo();
+            });
           });
-          fetchPluginInfo();
         },
         onFailed: () => {
           setInstallingOrRemoving(false);
@@ -202,7 +233,30 @@ export function ComfyUIManager(node: NodeProps) {
         },
       });
     },
-    [notificationAPI, fetchPluginInfo],
+    [notificationAPI, fetchPluginInfo, fetchInstalledPluginInfo, pollPluginJob],
+  );
+
+  const onRemove = useCallback(
+    (plugin: ComfyUIPlugin) => {
+      runPluginJob(
+        plugin,
+        'remove',
+        'Plugin Removed',
+        `Plugin ${plugin.name} has been removed and its nodes were unloaded.`,
+      );
+    },
+    [runPluginJob],
+  );
+  const onInstall = useCallback(
+    (plugin: ComfyUIPlugin) => {
+      runPluginJob(
+        plugin,
+        'install',
+        'Plugin Installed',
+        `Plugin from ${plugin.name} has been installed and its nodes were loaded.`,
+      );
+    },
+    [runPluginJob],
   );
 
   const pluginInfoToList = useCallback(
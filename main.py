@@ -1,4 +1,5 @@
 import os
+import uuid
 import json
 import sys
 import traceback
@@ -7,6 +8,9 @@ import importlib.util
 import pathlib
 import inspect
 import subprocess
+import asyncio
+import threading
+import concurrent.futures
 import torch
 
 import folder_paths # type: ignore
@@ -23,6 +27,8 @@ from backend.utils import SafeJSONResponse
 
 # THE FOLLOWING CODE ARE TAKEN AND MODIFIED FROM COMFY-UI
 
+from comfy.cli_args import args
+from . import _node_info
 from ._nodes import NODE_CLASS_MAPPINGS as _NODE_CLASS_MAPPINGS, NODE_DISPLAY_NAME_MAPPINGS as _NODE_DISPLAY_NAME_MAPPINGS, EXTENSION_WEB_DIRS as _EXTENSION_WEB_DIRS
 
 EXTENSION_WEB_DIRS = _EXTENSION_WEB_DIRS # Well, we can't do anything with js injection
@@ -30,50 +36,171 @@ NODE_CLASS_MAPPINGS: Dict[str, type] = _NODE_CLASS_MAPPINGS # Similar to node_lo
 NODE_DISPLAY_NAME_MAPPINGS: Dict[str, str] = _NODE_DISPLAY_NAME_MAPPINGS
 
 
-def load_custom_node(module_path, ignore=set()):
-    module_name = os.path.basename(module_path)
+custom_node_manifest_file = os.path.join(folder_paths.get_cache_directory(), "custom_nodes_manifest.json")
+CUSTOM_NODE_MANIFEST_VERSION = 2
+LAZY_FORWARDED_CLASSMETHODS = ("IS_CHANGED", "VALIDATE_INPUTS")
+lazy_custom_node_modules: Dict[str, Any] = {} # module_path -> module, for packs registered from the manifest
+lazy_custom_node_lock = threading.Lock()
+custom_node_names: Dict[str, List[str]] = {} # module_path -> names of the nodes registered by the custom node pack
+base_node_names = set() # builtin and comfy_extras nodes, custom node packs can't override them
+
+
+def custom_node_module_name(module_path):
     if os.path.isfile(module_path):
-        sp = os.path.splitext(module_path)
-        module_name = sp[0]
+        return os.path.splitext(module_path)[0]
+    return os.path.basename(module_path)
+
+
+def import_custom_node(module_path):
+    module_name = custom_node_module_name(module_path)
     try:
         if os.path.isfile(module_path):
             module_spec = importlib.util.spec_from_file_location(module_name, location=module_path)
-            module_dir = os.path.split(module_path)[0]
         else:
             module_spec = importlib.util.spec_from_file_location(module_name, location=os.path.join(module_path, "__init__.py"))
-            module_dir = module_path
 
         assert module_spec is not None
         assert module_spec.loader is not None
         module = importlib.util.module_from_spec(module_spec)
         sys.modules[module_name] = module
         module_spec.loader.exec_module(module)
-
-        if hasattr(module, "WEB_DIRECTORY") and getattr(module, "WEB_DIRECTORY") is not None:
-            web_dir = os.path.abspath(os.path.join(module_dir, getattr(module, "WEB_DIRECTORY")))
-            if os.path.isdir(web_dir):
-                EXTENSION_WEB_DIRS[module_name] = web_dir
-
-        if hasattr(module, "NODE_CLASS_MAPPINGS") and getattr(module, "NODE_CLASS_MAPPINGS") is not None:
-            for name in module.NODE_CLASS_MAPPINGS:
-                if name not in ignore:
-                    NODE_CLASS_MAPPINGS[name] = module.NODE_CLASS_MAPPINGS[name]
-            if hasattr(module, "NODE_DISPLAY_NAME_MAPPINGS") and getattr(module, "NODE_DISPLAY_NAME_MAPPINGS") is not None:
-                NODE_DISPLAY_NAME_MAPPINGS.update(module.NODE_DISPLAY_NAME_MAPPINGS)
-            return True
-        else:
-            print(f"Skip {module_path} module for custom nodes due to the lack of NODE_CLASS_MAPPINGS.")
-            return False
+        return module
     except Exception as e:
         print(traceback.format_exc())
         print(f"Cannot import {module_path} module for custom nodes:", e)
+        return None
+
+
+def register_custom_node(module, module_path, ignore=set()):
+    module_name = custom_node_module_name(module_path)
+    if os.path.isfile(module_path):
+        module_dir = os.path.split(module_path)[0]
+    else:
+        module_dir = module_path
+
+    if hasattr(module, "WEB_DIRECTORY") and getattr(module, "WEB_DIRECTORY") is not None:
+        web_dir = os.path.abspath(os.path.join(module_dir, getattr(module, "WEB_DIRECTORY")))
+        if os.path.isdir(web_dir):
+            EXTENSION_WEB_DIRS[module_name] = web_dir
+
+    if hasattr(module, "NODE_CLASS_MAPPINGS") and getattr(module, "NODE_CLASS_MAPPINGS") is not None:
+        for name in module.NODE_CLASS_MAPPINGS:
+            if name not in ignore:
+                NODE_CLASS_MAPPINGS[name] = module.NODE_CLASS_MAPPINGS[name]
+                custom_node_names.setdefault(module_path, []).append(name)
+        if hasattr(module, "NODE_DISPLAY_NAME_MAPPINGS") and getattr(module, "NODE_DISPLAY_NAME_MAPPINGS") is not None:
+            NODE_DISPLAY_NAME_MAPPINGS.update(module.NODE_DISPLAY_NAME_MAPPINGS)
+        return True
+    else:
+        print(f"Skip {module_path} module for custom nodes due to the lack of NODE_CLASS_MAPPINGS.")
         return False
 
 
-def load_custom_nodes():
-    base_node_names = set(NODE_CLASS_MAPPINGS.keys())
+def load_custom_node(module_path, ignore=set()):
+    module = import_custom_node(module_path)
+    if module is None:
+        return False
+    return register_custom_node(module, module_path, ignore)
+
+
+def custom_node_manifest_entry(module, module_path):
+    # Captures what is needed to register the nodes of a pack without importing it. Returns None if the pack can't be
+    # registered lazily (INPUT_TYPES() or the defaults are not JSON serializable).
+    nodes = {}
+    try:
+        for name, t in module.NODE_CLASS_MAPPINGS.items():
+            sig = inspect.signature(getattr(t, t.FUNCTION))
+            node = {
+                "CATEGORY": t.CATEGORY,
+                "FUNCTION": t.FUNCTION,
+                "INPUT_TYPES": t.INPUT_TYPES(),
+                "RETURN_TYPES": t.RETURN_TYPES,
+                "defaults": {k: v.default for k, v in sig.parameters.items() if v.default is not inspect.Parameter.empty},
+                "classmethods": [attr for attr in LAZY_FORWARDED_CLASSMETHODS if hasattr(t, attr)],
+            }
+            for attr in ("RETURN_NAMES", "OUTPUT_IS_LIST", "OUTPUT_NODE", "DESCRIPTION"):
+                if hasattr(t, attr):
+                    node[attr] = getattr(t, attr)
+            nodes[name] = node
+        entry = {
+            "version": CUSTOM_NODE_MANIFEST_VERSION,
+            "fingerprint": _node_info.source_fingerprint([module_path], []),
+            "nodes": nodes,
+            "display_names": getattr(module, "NODE_DISPLAY_NAME_MAPPINGS", None) or {},
+        }
+        json.dumps(entry)
+        return entry
+    except Exception as e:
+        print(f"Custom node {module_path} can not be registered lazily: {e}")
+        return None
+
+
+def lazy_node_class(module_path, name, node):
+    # Stand-in for a node class of a pack that is not imported yet. The pack is imported the first time the node is
+    # executed, one of its IS_CHANGED/VALIDATE_INPUTS is called or its input types are refreshed (load_lazy_class),
+    # after which INPUT_TYPES(), those classmethods and the execution are forwarded to the real class. Like a loaded
+    # node, the execution reuses one instance of it.
+    def real_class():
+        with lazy_custom_node_lock:
+            if module_path not in lazy_custom_node_modules:
+                time_before = time.perf_counter()
+                module = import_custom_node(module_path)
+                if module is None or name not in (getattr(module, "NODE_CLASS_MAPPINGS", None) or {}):
+                    raise RuntimeError(f"Cannot import {module_path} module for custom node {name}")
+                lazy_custom_node_modules[module_path] = module
+                print("{:6.1f} seconds (LAZY): {}".format(time.perf_counter() - time_before, module_path))
+            return lazy_custom_node_modules[module_path].NODE_CLASS_MAPPINGS[name]
+
+    def INPUT_TYPES(cls):
+        if module_path in lazy_custom_node_modules:
+            return real_class().INPUT_TYPES()
+        return node["INPUT_TYPES"]
+
+    def load_lazy_class(cls):
+        return real_class()
+
+    instance = []
+
+    def run(self, *args, **kwargs):
+        t = real_class()
+        if len(instance) == 0:
+            instance.append(t())
+        return getattr(instance[0], t.FUNCTION)(*args, **kwargs)
+
+    def forward(attr):
+        def classmethod_(cls, *args, **kwargs):
+            return getattr(real_class(), attr)(*args, **kwargs)
+        return classmethod(classmethod_)
+
+    run.__signature__ = inspect.Signature([inspect.Parameter("self", inspect.Parameter.POSITIONAL_OR_KEYWORD)] + [inspect.Parameter(k, inspect.Parameter.KEYWORD_ONLY, default=v) for k, v in node["defaults"].items()])
+
+    attrs = {k: tuple(v) if type(v) == list else v for k, v in node.items() if k not in ("INPUT_TYPES", "defaults", "classmethods")}
+    attrs["INPUT_TYPES"] = classmethod(INPUT_TYPES)
+    attrs["load_lazy_class"] = classmethod(load_lazy_class)
+    for attr in node["classmethods"]:
+        attrs[attr] = forward(attr)
+    attrs[node["FUNCTION"]] = run
+    return type(name, (object,), attrs)
+
+
+def register_lazy_custom_node(module_path, entry, ignore=set()):
+    for name, node in entry["nodes"].items():
+        if name not in ignore:
+            NODE_CLASS_MAPPINGS[name] = lazy_node_class(module_path, name, node)
+            custom_node_names.setdefault(module_path, []).append(name)
+    NODE_DISPLAY_NAME_MAPPINGS.update(entry["display_names"])
+    return True
+
+
+def timed_import_custom_node(module_path):
+    time_before = time.perf_counter()
+    module = import_custom_node(module_path)
+    return time.perf_counter() - time_before, module
+
+
+def custom_node_module_paths():
     node_paths = folder_paths.get_folder_paths("custom_nodes")
-    node_import_times = []
+    module_paths = []
     for custom_node_path in node_paths:
         possible_modules = os.listdir(os.path.realpath(custom_node_path))
         if "__pycache__" in possible_modules:
@@ -85,18 +212,64 @@ def load_custom_nodes():
                 continue
             if module_path.endswith(".disabled"):
                 continue
+            module_paths.append(module_path)
+    return module_paths
+
+
+def load_custom_nodes():
+    base_node_names.update(NODE_CLASS_MAPPINGS.keys())
+    module_paths = custom_node_module_paths()
+    manifest = {}
+    if args.lazy_custom_nodes and os.path.exists(custom_node_manifest_file):
+        try:
+            with open(custom_node_manifest_file, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring custom node manifest {custom_node_manifest_file}: {e}")
+    lazy_entries = {p: manifest[p] for p in module_paths if p in manifest and manifest[p].get("version") == CUSTOM_NODE_MANIFEST_VERSION and manifest[p]["fingerprint"] == _node_info.source_fingerprint([p], [])}
+
+    # packs marked as safe are imported by a thread pool while the others are imported here, they are still registered
+    # in the original order so that which pack wins for a duplicated node name doesn't change
+    executor = None
+    futures = {}
+    parallel_paths = [p for p in module_paths if p not in lazy_entries and os.path.basename(p) in args.parallel_custom_nodes]
+    if len(parallel_paths) > 0:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.custom_node_import_workers))
+        futures = {p: executor.submit(timed_import_custom_node, p) for p in parallel_paths}
+
+    node_import_times = []
+    new_manifest = {}
+    for module_path in module_paths:
+        if module_path in lazy_entries:
             time_before = time.perf_counter()
-            success = load_custom_node(module_path, base_node_names)
-            node_import_times.append((time.perf_counter() - time_before, module_path, success))
+            success = register_lazy_custom_node(module_path, lazy_entries[module_path], base_node_names)
+            new_manifest[module_path] = lazy_entries[module_path]
+            node_import_times.append((time.perf_counter() - time_before, module_path, success, " (LAZY)"))
+            continue
+
+        if module_path in futures:
+            import_time, module = futures[module_path].result()
+        else:
+            import_time, module = timed_import_custom_node(module_path)
+        success = module is not None and register_custom_node(module, module_path, base_node_names)
+        if success and args.lazy_custom_nodes:
+            entry = custom_node_manifest_entry(module, module_path)
+            if entry is not None:
+                new_manifest[module_path] = entry
+        node_import_times.append((import_time, module_path, success, "" if success else " (IMPORT FAILED)"))
+
+    if executor is not None:
+        executor.shutdown()
+
+    if args.lazy_custom_nodes and new_manifest != manifest:
+        with open(custom_node_manifest_file + ".tmp", 'w') as f:
+            json.dump(new_manifest, f)
+        os.replace(custom_node_manifest_file + ".tmp", custom_node_manifest_file)
 
     if len(node_import_times) > 0:
         print("\nImport times for custom nodes:")
         for n in sorted(node_import_times):
-            if n[2]:
-                import_message = ""
-            else:
-                import_message = " (IMPORT FAILED)"
-            print("{:6.1f} seconds{}:".format(n[0], import_message), n[1])
+            print("{:6.1f} seconds{}:".format(n[0], n[3]), n[1])
         print()
 
 
@@ -130,6 +303,7 @@ def init_custom_nodes():
         "nodes_morphology.py",
         "nodes_stable_cascade.py",
         "nodes_differential_diffusion.py",
+        "nodes_cross_attn_cache.py",
     ]
 
     import_failed = []
@@ -156,102 +330,10 @@ folder_paths.add_model_folder_path("clip", os.path.join(folder_paths.get_output_
 folder_paths.add_model_folder_path("vae", os.path.join(folder_paths.get_output_directory(), "vae"))
 
 
-def node_info(node_class):
-    obj_class = NODE_CLASS_MAPPINGS[node_class]
-    info = {}
-    info['input'] = obj_class.INPUT_TYPES()
-    info['output'] = obj_class.RETURN_TYPES
-    info['output_is_list'] = obj_class.OUTPUT_IS_LIST if hasattr(obj_class, 'OUTPUT_IS_LIST') else [False] * len(obj_class.RETURN_TYPES)
-    info['output_name'] = obj_class.RETURN_NAMES if hasattr(obj_class, 'RETURN_NAMES') else info['output']
-    info['name'] = node_class
-    info['display_name'] = NODE_DISPLAY_NAME_MAPPINGS[node_class] if node_class in NODE_DISPLAY_NAME_MAPPINGS.keys() else node_class
-    info['description'] = obj_class.DESCRIPTION if hasattr(obj_class, 'DESCRIPTION') else ''
-    info['category'] = 'sd'
-    if hasattr(obj_class, 'OUTPUT_NODE') and obj_class.OUTPUT_NODE == True:
-        info['output_node'] = True
-    else:
-        info['output_node'] = False
-
-    if hasattr(obj_class, 'CATEGORY'):
-        info['category'] = obj_class.CATEGORY
-    return info
-
-
 import backend.log as log
 
 logger = log.get_logger()
-
-def convert_type(type_original: Any):
-    if type(type_original) == str:
-        return type_original
-    if type(type_original) == list:
-        # if all elements are string, then it is a literal
-        if all(isinstance(x, str) for x in type_original):
-            _type_original = [f"'{x}'" for x in type_original]
-            return f"typing.Literal[{', '.join(_type_original)}]"
-    logger.error(f"Type {type(type_original)} with value{type_original} is not supported. Please report this issue to https://github.com/KokeCacao/KatUI/issues")
-    return "Any"
-
-
-def node_info_to_node_dict(node_str_types: str, node_info: Dict[str, Any], t: type):
-    # constructing input_port_id_to_type
-    required_input_port_id = []
-    required_input_type = []
-    if 'input' in node_info and 'required' in node_info['input']:
-        required_input_port_id = list(node_info['input']['required'].keys())
-        required_input_type = [convert_type(x[0]) for x in node_info['input']['required'].values()]
-
-    optional_input_port_id = []
-    optional_input_type = []
-    if 'input' in node_info and 'optional' in node_info['input']:
-        optional_input_port_id = list(node_info['input']['optional'].keys())
-        optional_input_type = [convert_type(x[0]) for x in node_info['input']['optional'].values()]
-
-    input_port_id = required_input_port_id + optional_input_port_id
-    input_type = required_input_type + optional_input_type
-
-    input_port_id_to_type = dict(zip(input_port_id, input_type))
-
-    # constructing output_port_id_to_type
-    output_type = [a if not b else "<class 'list'>" for a, b in zip(node_info['output'], node_info['output_is_list'])]
-    output_port_id_to_type = dict(zip(node_info['output_name'], output_type))
-    if len(output_port_id_to_type) == 0:
-        # if there is no output, then it is a None type
-        output_port_id_to_type = {"output": "None"}
-
-    # constructing input_port_id_to_default
-    execute_fn = getattr(t, t.FUNCTION)
-    sig = inspect.signature(execute_fn)
-    input_port_id_to_default = {k: v.default for k, v in sig.parameters.items() if v.default is not inspect.Parameter.empty}
-
-    # input_port_id_to_default = {key: None for key in optional_input_port_id}
-
-    return {
-        "node_type": node_str_types,
-        "class_name": node_info['name'], # Not used since they don't have custom UI
-        "display_name": node_info['display_name'],
-        "input_port_id_to_type": input_port_id_to_type,
-        "output_port_id_to_type": output_port_id_to_type,
-        "input_port_id_to_default": input_port_id_to_default,
-        "signal_to_default_data": {},
-        "data": {
-            "hidden": False,
-            "singleton": False,
-            "persistent": False,
-            "inoperable": False,
-        },
-        "inner_types": {}, # I don't need inner types because I assume no args and kwargs
-        "python_path": None, # I am not using it
-        "metadata": {
-            "author": None,
-            "author_url": None,
-            "node_description": node_info['description'],
-            "input_description": {},
-            "output_description": {},
-        },
-        "plugin_name": node_info['category'].replace('/', '.'),
-        "plugin_url": None,
-    }
+_node_info.logger = logger
 
 
 node_str_types = [t.CATEGORY.replace('/', '.') + "." + name for name, t in NODE_CLASS_MAPPINGS.items()]
@@ -259,7 +341,9 @@ node_python_types = list(NODE_CLASS_MAPPINGS.values())
 main_pys = [] # TODO: where is the prestart file?
 repo_name = "ComfyUIManager"
 plugin = None
-dicts = {t.CATEGORY.replace('/', '.') + '.' + name: node_info_to_node_dict(t.CATEGORY.replace('/', '.') + '.' + name, node_info(name), t) for name, t in NODE_CLASS_MAPPINGS.items()}
+node_info_cache_file = os.path.join(folder_paths.get_cache_directory(), "node_info_cache.json")
+node_source_paths = [os.path.join(os.path.dirname(os.path.realpath(__file__)), x) for x in ("main.py", "_nodes.py", "_folder_paths.py", "comfy", "comfy_extras")] + folder_paths.get_folder_paths("custom_nodes")
+dicts = _node_info.load_or_build_node_dicts(node_info_cache_file, node_source_paths, NODE_CLASS_MAPPINGS, NODE_DISPLAY_NAME_MAPPINGS)
 
 installed_plugins_cache_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), "installed_plugins_cache.json")
 
@@ -323,6 +407,122 @@ node_loader.add_plugin(
     dicts=dicts,
 )
 
+
+# the registries node_loader.add_plugin fills, named like its arguments
+NODE_LOADER_REGISTRIES = ("node_str_types", "node_python_types", "dicts")
+
+
+def remove_from_node_loader(removed_str_types, removed_python_types):
+    # add_plugin has no counterpart, so the removed nodes are dropped from the registries it fills and nothing else
+    for name in NODE_LOADER_REGISTRIES:
+        value = getattr(node_loader, name, None)
+        if isinstance(value, dict):
+            for k in removed_str_types:
+                value.pop(k, None)
+        elif isinstance(value, list):
+            value[:] = [x for x in value if not any(x is y for y in removed_python_types) and not (type(x) == str and x in removed_str_types)]
+
+
+def add_custom_nodes(modules):
+    # modules are (module_path, module, node dicts of its NODE_CLASS_MAPPINGS) from prepare_custom_node_sync, only the
+    # registration runs here. Nodes that are already registered are kept, a new pack can't replace them without a restart
+    ignore = set(NODE_CLASS_MAPPINGS.keys())
+    new_mappings = {}
+    new_dicts = {}
+    for module_path, module, module_dicts in modules:
+        if register_custom_node(module, module_path, ignore):
+            for name in custom_node_names.get(module_path, []):
+                new_mappings[name] = NODE_CLASS_MAPPINGS[name]
+                k = _node_info.node_type_name(name, NODE_CLASS_MAPPINGS[name])
+                new_dicts[k] = module_dicts[k]
+    if len(new_mappings) == 0:
+        return []
+
+    new_str_types = [_node_info.node_type_name(name, t) for name, t in new_mappings.items()]
+    new_python_types = list(new_mappings.values())
+    for t in new_python_types:
+        monkey_patch_comfy_nodes(t)
+
+    dicts.update(new_dicts)
+    node_str_types.extend(new_str_types)
+    node_python_types.extend(new_python_types)
+    node_loader.add_plugin(
+        node_str_types=new_str_types,
+        node_python_types=new_python_types,
+        main_pys=[],
+        repo_name=pathlib.Path(repo_name),
+        plugin=plugin,
+        dicts=new_dicts,
+    )
+    return new_str_types
+
+
+def forget_custom_node_modules(module_path):
+    module_name = custom_node_module_name(module_path)
+    for m in [m for m in sys.modules if m == module_name or m.startswith(module_name + ".")]:
+        del sys.modules[m]
+
+
+def remove_custom_nodes(module_paths):
+    removed_str_types = []
+    removed_python_types = []
+    for module_path in module_paths:
+        for name in custom_node_names.pop(module_path, []):
+            t = NODE_CLASS_MAPPINGS.pop(name, None)
+            NODE_DISPLAY_NAME_MAPPINGS.pop(name, None)
+            if t is None:
+                continue
+            k = _node_info.node_type_name(name, t)
+            dicts.pop(k, None)
+            if k in node_str_types:
+                node_str_types.remove(k)
+            if t in node_python_types:
+                node_python_types.remove(t)
+            removed_str_types.append(k)
+            removed_python_types.append(t)
+
+        EXTENSION_WEB_DIRS.pop(custom_node_module_name(module_path), None)
+        lazy_custom_node_modules.pop(module_path, None)
+
+    remove_from_node_loader(removed_str_types, removed_python_types)
+    return removed_str_types
+
+
+def custom_node_fingerprints():
+    return {p: _node_info.source_fingerprint([p], []) for p in custom_node_module_paths()}
+
+
+def prepare_custom_node_sync(fingerprints_before):
+    """Lists the custom node packs and imports the ones that appeared or whose files changed since fingerprints_before
+    (from custom_node_fingerprints) was taken. Runs on plugin_job_executor so the imports don't block the event loop,
+    apply_custom_node_sync then swaps the registered nodes.
+    """
+    fingerprints = custom_node_fingerprints()
+    changed = [p for p in fingerprints if p in fingerprints_before and fingerprints[p] != fingerprints_before[p]]
+    removed = [p for p in fingerprints_before if p not in fingerprints]
+    for module_path in removed + changed:
+        forget_custom_node_modules(module_path)
+
+    modules = []
+    for module_path in [p for p in fingerprints if p not in fingerprints_before] + changed:
+        module = import_custom_node(module_path)
+        if module is None:
+            continue
+        mappings = getattr(module, "NODE_CLASS_MAPPINGS", None) or {}
+        display_names = getattr(module, "NODE_DISPLAY_NAME_MAPPINGS", None) or {}
+        modules.append((module_path, module, _node_info.build_node_dicts(mappings, display_names)))
+    return removed + changed, modules, len(changed)
+
+
+def apply_custom_node_sync(removed_paths, modules, changed_count):
+    """Unloads the removed and changed packs and registers the imported ones, without re-initializing node_loader
+    (which re-executes every plugin and rebuilds every node dict). Runs on the event loop thread like any other
+    change to the nodes.
+    """
+    removed = remove_custom_nodes(removed_paths)
+    added = add_custom_nodes(modules)
+    print(f"Custom nodes reloaded: {len(added)} added, {len(removed)} removed, {changed_count} packs updated")
+
 from fastapi import Request
 from backend import variable
 from backend.app import app
@@ -332,7 +532,7 @@ from ._external_functions import *
 
 
 # not using ComfyUIManager's gitclone_install because I don't want to add git to the dependencies
-def gitclone_install(files):
+def gitclone_install(files, log=None):
     print(f"install: {files}")
     for url in files:
         if not is_valid_url(url):
@@ -357,27 +557,153 @@ def gitclone_install(files):
             #     repo.close()
 
             # clone github repository to custom_nodes_path
-            try:
-                if not url.endswith(".git"):
-                    url += ".git"
-                # TODO: check if the plugin is already installed
-                print(f"Installing plugin from {url}")
-                out = subprocess.check_output(['git', 'clone', url], cwd=custom_nodes_path, text=True).strip()
-                print(f"Executed \"git clone {url}\" -> {out}")
-            except subprocess.CalledProcessError as e:
-                raise Exception(f"Failed to install plugin from {url} due to {e}")
-
-            if not execute_install_script(url, repo_path):
+            if not url.endswith(".git"):
+                url += ".git"
+            # TODO: check if the plugin is already installed
+            print(f"Installing plugin from {url}")
+            code = run_script(['git', 'clone', '--progress', url], cwd=custom_nodes_path, log=log)
+            if code != 0:
+                raise Exception(f"Failed to install plugin from {url} due to git clone exiting with {code}")
+
+            if not execute_install_script(url, repo_path, log=log):
                 return False
 
         except Exception as e:
             print(f"Install(git-clone) error: {url} / {e}", file=sys.stderr)
+            if log is not None:
+                log(f"Install(git-clone) error: {url} / {e}")
             return False
 
     print("Installation was successful.")
     return True
 
 
+class PluginJob:
+    """An install or remove of a plugin running on plugin_job_executor, its status and output lines are served by
+    /ComfyUIManager/plugins/jobs/{job_id}
+    """
+
+    def __init__(self, kind: str, payload: Dict[Any, Any]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.name = payload.get('name')
+        self.status: Literal['queued', 'running', 'succeeded', 'failed'] = 'queued'
+        self.logs: List[str] = []
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.task = None
+
+    def log(self, msg: str):
+        self.logs.append(msg.rstrip("\n"))
+
+    def to_dict(self, since: int = 0):
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "name": self.name,
+            "status": self.status,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+            "logs": self.logs[since:],
+            "log_offset": len(self.logs),
+        }
+
+
+# one worker: pip and git must not run concurrently on the same environment
+plugin_job_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+plugin_jobs: Dict[str, PluginJob] = {}
+plugin_job_lock = asyncio.Lock()
+MAX_FINISHED_PLUGIN_JOBS = 32
+
+
+def update_installed_plugins_cache(name, payload):
+    installed_plugins_cache = {}
+    if os.path.exists(installed_plugins_cache_file):
+        with open(installed_plugins_cache_file, 'r') as f:
+            installed_plugins_cache = json.load(f)
+    if payload is None:
+        installed_plugins_cache.pop(name, None)
+    else:
+        installed_plugins_cache[name] = payload
+    with open(installed_plugins_cache_file, 'w') as f:
+        json.dump(installed_plugins_cache, f)
+
+
+def install_plugin(job: PluginJob, payload: Dict[Any, Any]):
+    files: List[str] = payload['files']
+    install_type: Literal['git-clone', 'copy', 'unzip'] = payload['install_type']
+
+    job.log(f"Installing {payload['name']} ({install_type})")
+    if install_type == 'git-clone':
+        success = gitclone_install(files, log=job.log)
+    elif install_type == 'copy':
+        success = copy_install(files, log=job.log)
+    elif install_type == 'unzip':
+        success = unzip_install(files, log=job.log)
+    else:
+        raise ValueError(f"Invalid install type {install_type}")
+
+    if success:
+        update_installed_plugins_cache(payload['name'], payload)
+    return success
+
+
+def remove_plugin(job: PluginJob, payload: Dict[Any, Any]):
+    files: List[str] = payload['files']
+    install_type: Literal['git-clone', 'copy', 'unzip'] = payload['install_type']
+
+    job.log(f"Removing {payload['name']} ({install_type})")
+    if install_type == 'git-clone':
+        success = gitclone_uninstall(files, log=job.log)
+    elif install_type == 'copy':
+        success = copy_uninstall(files, log=job.log)
+    else:
+        raise ValueError(f"Invalid install type {install_type}")
+
+    if success:
+        update_installed_plugins_cache(payload['name'], None)
+    return success
+
+
+def run_plugin_job_files(job: PluginJob, fn, payload: Dict[Any, Any]):
+    # listed right before this job touches the files so packs installed by earlier jobs aren't seen as new
+    fingerprints_before = custom_node_fingerprints()
+    job.status = 'running'
+    return fn(job, payload), fingerprints_before
+
+
+async def run_plugin_job(job: PluginJob, fn, payload: Dict[Any, Any]):
+    try:
+        # one job at a time from start to sync, the next job only lists the packs once this one is loaded
+        async with plugin_job_lock:
+            # the install itself runs on plugin_job_executor so the event loop keeps serving requests
+            loop = asyncio.get_running_loop()
+            success, fingerprints_before = await loop.run_in_executor(plugin_job_executor, run_plugin_job_files, job, fn, payload)
+            # the packs that changed are imported on the executor too, only their registration runs on the loop
+            sync = await loop.run_in_executor(plugin_job_executor, prepare_custom_node_sync, fingerprints_before)
+            apply_custom_node_sync(*sync)
+        job.status = 'succeeded' if success else 'failed'
+    except Exception as e:
+        print(traceback.format_exc())
+        job.error = str(e)
+        job.status = 'failed'
+    job.finished = time.time()
+    job.log(f"{job.kind} {job.status}")
+
+    finished = [j for j in plugin_jobs.values() if j.finished is not None]
+    for j in sorted(finished, key=lambda j: j.finished)[:max(0, len(finished) - MAX_FINISHED_PLUGIN_JOBS)]:
+        plugin_jobs.pop(j.id, None)
+
+
+def start_plugin_job(kind: str, fn, payload: Dict[Any, Any]):
+    job = PluginJob(kind, payload)
+    plugin_jobs[job.id] = job
+    job.task = asyncio.create_task(run_plugin_job(job, fn, payload))
+    return job
+
+
 @app.get('/ComfyUIManager/plugins')
 async def comfyui_manager_plugin(request: Request):
     """Client request to get installed ComfyUI plugins
@@ -396,9 +722,33 @@ async def comfyui_manager_plugin(request: Request):
     return SafeJSONResponse(status_code=200, content=installed_plugins_cache)
 
 
+@app.get('/ComfyUIManager/model_cache')
+async def comfyui_manager_model_cache(request: Request):
+    """Client request to get hit/miss/eviction counters and resident bytes of the loader model cache
+    """
+    import comfy.model_cache
+    return SafeJSONResponse(status_code=200, content=comfy.model_cache.stats())
+
+
+@app.get('/ComfyUIManager/image_writer')
+async def comfyui_manager_image_writer(request: Request):
+    """Client request to get the queue depth and counters of the background image writer of SaveImage/PreviewImage
+    """
+    import comfy.image_writer
+    return SafeJSONResponse(status_code=200, content=comfy.image_writer.stats())
+
+
+@app.get('/ComfyUIManager/input_image_cache')
+async def comfyui_manager_input_image_cache(request: Request):
+    """Client request to get hit/miss/eviction counters and resident bytes of the LoadImage/LoadImageMask cache
+    """
+    import comfy.input_image_cache
+    return SafeJSONResponse(status_code=200, content=comfy.input_image_cache.stats())
+
+
 @app.post('/ComfyUIManager/plugins/install')
 async def comfyui_manager_install_plugin(request: Request, payload: Dict[Any, Any]):
-    """Client request to install ComfyUI plugin
+    """Client request to install ComfyUI plugin, the install runs in the background
 
     Args:
         payload (Dict[Any, Any]): data of the plugin
@@ -413,68 +763,60 @@ async def comfyui_manager_install_plugin(request: Request, payload: Dict[Any, An
                     ],
                     "install_type": "copy"
                 }
+
+    Returns:
+        {"job_id": ...} to poll /ComfyUIManager/plugins/jobs/{job_id} with
     """
     if variable.node_loader is None:
         return SafeJSONResponse(status_code=500, content={"error": "Server failed to load nodes."})
 
-    files: List[str] = payload['files']
-    install_type: Literal['git-clone', 'copy', 'unzip'] = payload['install_type']
-
-    if install_type == 'git-clone':
-        gitclone_install(files)
-    elif install_type == 'copy':
-        copy_install(files)
-    elif install_type == 'unzip':
-        unzip_install(files)
-    else:
-        raise ValueError(f"Invalid install type {install_type}")
-
-    installed_plugins_cache = {}
-    if os.path.exists(installed_plugins_cache_file):
-        with open(installed_plugins_cache_file, 'r') as f:
-            installed_plugins_cache = json.load(f)
-    installed_plugins_cache[payload['name']] = payload
-    with open(installed_plugins_cache_file, 'w') as f:
-        json.dump(installed_plugins_cache, f)
+    if payload.get('install_type') not in ('git-clone', 'copy', 'unzip'):
+        return SafeJSONResponse(status_code=400, content={"error": f"Invalid install type {payload.get('install_type')}"})
 
-    # reload plugins
-    variable.node_loader.__init__(external_node_path=variable.node_loader.external_node_path)
-    variable.node_loader.execute_mainpy_files(variable_module=variable)
-
-    return SafeJSONResponse(status_code=200, content={})
+    job = start_plugin_job('install', install_plugin, payload)
+    return SafeJSONResponse(status_code=202, content={"job_id": job.id})
 
 
 @app.post('/ComfyUIManager/plugins/remove')
 async def comfyui_manager_remove_plugin(request: Request, payload: Dict[Any, Any]):
-    """Client request to remove ComfyUI plugin
+    """Client request to remove ComfyUI plugin, the removal runs in the background
 
     Args:
         payload (Dict[Any, Any]): data of the plugin
+
+    Returns:
+        {"job_id": ...} to poll /ComfyUIManager/plugins/jobs/{job_id} with
     """
     if variable.node_loader is None:
         return SafeJSONResponse(status_code=500, content={"error": "Server failed to load nodes."})
 
-    files: List[str] = payload['files']
-    install_type: Literal['git-clone', 'copy', 'unzip'] = payload['install_type']
-
-    if install_type == 'git-clone':
-        gitclone_uninstall(files)
-    elif install_type == 'copy':
-        copy_uninstall(files)
-    elif install_type == 'unzip':
+    install_type = payload.get('install_type')
+    if install_type == 'unzip':
         return SafeJSONResponse(status_code=500, content={"error": "Since ComfyUIManager in ComfyUI doesn't support uninstall anything that was installed using unzip method, please remove the files manually."})
-    else:
-        raise ValueError(f"Invalid install type {install_type}")
+    if install_type not in ('git-clone', 'copy'):
+        return SafeJSONResponse(status_code=400, content={"error": f"Invalid install type {install_type}"})
+
+    job = start_plugin_job('remove', remove_plugin, payload)
+    return SafeJSONResponse(status_code=202, content={"job_id": job.id})
+
+
+@app.get('/ComfyUIManager/plugins/jobs')
+async def comfyui_manager_plugin_jobs(request: Request):
+    """Client request to list the plugin install/remove jobs without their logs
+    """
+    return SafeJSONResponse(status_code=200, content=[{k: v for k, v in job.to_dict().items() if k != 'logs'} for job in plugin_jobs.values()])
 
-    if os.path.exists(installed_plugins_cache_file):
-        with open(installed_plugins_cache_file, 'r') as f:
-            installed_plugins_cache = json.load(f)
-        installed_plugins_cache.pop(payload['name'], None)
-        with open(installed_plugins_cache_file, 'w') as f:
-            json.dump(installed_plugins_cache, f)
 
-    # reload plugins
-    variable.node_loader.__init__(external_node_path=variable.node_loader.external_node_path)
-    variable.node_loader.execute_mainpy_files(variable_module=variable)
+@app.get('/ComfyUIManager/plugins/jobs/{job_id}')
+async def comfyui_manager_plugin_job(request: Request, job_id: str, since: int = 0):
+    """Client request to get the status of a plugin install/remove job
 
-    return SafeJSONResponse(status_code=200, content={})
+    Args:
+        job_id (str): id returned by /ComfyUIManager/plugins/install or /ComfyUIManager/plugins/remove
+        since (int): only return the log lines after this offset, pass the log_offset of the previous response to
+            stream the output
+    """
+    job = plugin_jobs.get(job_id)
+    if job is None:
+        return SafeJSONResponse(status_code=404, content={"error": f"Unknown job {job_id}"})
+    return SafeJSONResponse(status_code=200, content=job.to_dict(since))